@@ -1,20 +1,15 @@
 import streamlit as st
 import numpy as np
-import altair as alt
-import pandas as pd
 from datetime import datetime, timedelta
-from thompson_trader import (
-    ThompsonSamplingStockTrader,
-    portfolio1,
-    portfolio2,
-    run_multiple_simulations,
-    download_and_prepare_data,
-    get_sector_allocation,
-    calculate_buy_and_hold_performance,
-    calculate_random_selection_performance,
-    calculate_portfolio_risk_metrics
-)
-import time
+import os
+
+POLICY_LABELS = {
+    'thompson': 'Thompson Sampling',
+    'ucb1': 'UCB1',
+    'epsilon_greedy': 'Epsilon-Greedy',
+    'discounted': 'Discounted Thompson',
+    'sliding_window': 'Sliding-Window Thompson'
+}
 
 def format_delta(delta):
     if delta is None or delta == "":
@@ -512,6 +507,31 @@ with st.expander("What do these terms mean?", expanded=False):
     </div>
     """, unsafe_allow_html=True)
 
+# The page shell above renders before the heavier modules load: pandas comes in
+# with the simulation code, altair only once charts are built, and yfinance only
+# when prices are actually downloaded from Yahoo Finance
+import pandas as pd
+from thompson_trader import (
+    ThompsonSamplingStockTrader,
+    portfolio1,
+    portfolio2,
+    run_multiple_simulations,
+    run_portfolio_simulations,
+    compare_policies,
+    simulation_key,
+    SimulationCache,
+    download_and_prepare_data,
+    get_sector_allocation,
+    calculate_buy_and_hold_performance,
+    simulate_random_selection,
+    calculate_batch_risk_metrics,
+    downsample_frame,
+    CHART_MAX_POINTS
+)
+from instrumentation import PerformanceReport, SectionTimer, enable_timing_log
+from market_data import DEFAULT_PROVIDER, PROVIDERS, PriceCache, get_provider
+from policies import POLICIES
+
 # Simulation Settings Sidebar Header (Bright Purple Style)
 st.sidebar.markdown("""
 <div style='
@@ -564,6 +584,35 @@ st.sidebar.markdown("""
 """, unsafe_allow_html=True)
 end_date = st.sidebar.date_input("", datetime.today(), label_visibility="collapsed")
 
+st.sidebar.markdown("""
+<div style="color: #bae6fd; font-weight: 600; margin-bottom: 0.5rem;">
+    <strong>Data Provider</strong>
+</div>
+""", unsafe_allow_html=True)
+provider_names = list(PROVIDERS)
+default_provider = os.environ.get('THOMPSON_DATA_PROVIDER', DEFAULT_PROVIDER)
+data_provider = st.sidebar.selectbox(
+    "Data Provider", provider_names,
+    index=provider_names.index(default_provider) if default_provider in provider_names else 0,
+    label_visibility="collapsed"
+)
+data_dir = None
+if data_provider == 'directory':
+    data_dir = st.sidebar.text_input(
+        "Data Directory", os.environ.get('THOMPSON_DATA_DIR', ''),
+        placeholder="Folder of <SYMBOL>.csv / .parquet files"
+    )
+
+st.sidebar.markdown("""
+<div style="color: #bae6fd; font-weight: 600; margin-bottom: 0.5rem;">
+    <strong>Chart Resolution (points per chart)</strong>
+</div>
+""", unsafe_allow_html=True)
+# Time series are downsampled to at most this many rows per chart before they go
+# to the browser, so chart payloads stay the same size however long the date range is
+chart_points = st.sidebar.slider("Chart Resolution", 200, 4000, CHART_MAX_POINTS, step=100,
+                                 label_visibility="collapsed")
+
 # Reset Button
 st.sidebar.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
 if st.sidebar.button("Rerun Simulations"):
@@ -572,10 +621,61 @@ if st.sidebar.button("Rerun Simulations"):
     st.rerun()
 st.sidebar.markdown('</div>', unsafe_allow_html=True)
 
-# Cache stock data
+# Stage timings of the page run, filled in at the bottom of the script
+performance_panel = st.sidebar.expander("Performance", expanded=False)
+profile_runs = performance_panel.checkbox(
+    "Profile runs (cProfile + tracemalloc)", value=False, key="profile_runs",
+    help="Adds hot-function and allocation tables to the report; slows the run down"
+)
+
+# Providers are shared by all sessions; Yahoo Finance goes through the on-disk
+# price store, which survives restarts and only fetches ranges it does not hold
+@st.cache_resource(show_spinner=False)
+def get_data_provider(name, path=None):
+    if name == 'directory':
+        return get_provider(name, path=path or None)
+    if name == 'synthetic':
+        return get_provider(name)
+    return PriceCache(provider=get_provider(name))
+
+# Cache stock data; the leading underscore keeps the progress callback out of the cache key
 @st.cache_data(show_spinner=False)
-def get_stock_data(portfolio, start, end):
-    return download_and_prepare_data(portfolio, start, end)
+def get_stock_data(portfolio, start, end, provider_name=DEFAULT_PROVIDER, path=None, _progress=None):
+    return download_and_prepare_data(portfolio, start, end, provider=get_data_provider(provider_name, path),
+                                     progress=_progress)
+
+# Simulation outputs are shared by all sessions and keyed by a content hash of
+# everything they depend on, so returning to earlier settings is served from memory
+@st.cache_resource(show_spinner=False)
+def get_simulation_cache():
+    return SimulationCache(maxsize=32)
+
+simulation_cache = get_simulation_cache()
+
+def progress_reporter(progress_bar, offset, share, status_text=None, label=None):
+    """Map (done, total) callbacks onto a slice [offset, offset + share) of a progress bar"""
+    def report(done, total):
+        fraction = done / total if total else 1.0
+        progress_bar.progress(min(int(offset + share * fraction), 100))
+        if status_text is not None:
+            status_text.text(f"{label}... {fraction * 100:.0f}%")
+    return report
+
+# Spans go to the sidebar report and, as JSON lines, to the server log. A run that
+# ends in rerun() hands its report to the next one, so the download and
+# simulation stages show up next to the charts they feed
+enable_timing_log()
+perf_report = st.session_state.pop('pending_perf_report', None)
+if perf_report is None or perf_report.profile != profile_runs:
+    perf_report = PerformanceReport(profile=profile_runs, memory=profile_runs)
+perf_report.start()
+charts = SectionTimer('chart.')
+
+def rerun():
+    charts.end()
+    perf_report.stop()
+    st.session_state.pending_perf_report = perf_report
+    st.rerun()
 
 # Create loading state management
 if 'data_loaded' not in st.session_state:
@@ -583,6 +683,11 @@ if 'data_loaded' not in st.session_state:
 if 'simulations_run' not in st.session_state:
     st.session_state.simulations_run = False
 
+# Reload when the date range or data source changes
+data_key = (str(start_date), str(end_date), data_provider, data_dir)
+if st.session_state.get('data_key') != data_key:
+    st.session_state.data_loaded = False
+
 # Loading data with custom spinner
 if not st.session_state.data_loaded:
     st.markdown("""
@@ -592,18 +697,18 @@ if not st.session_state.data_loaded:
     </div>
     """, unsafe_allow_html=True)
     
-    # Simulate loading time for better UX
+    # Progress follows symbols actually loaded, half the bar per portfolio
     progress_bar = st.progress(0)
-    for i in range(100):
-        time.sleep(0.01)
-        progress_bar.progress(i + 1)
     
     # Download data
-    data1, stats1 = get_stock_data(portfolio1, start_date, end_date)
-    data2, stats2 = get_stock_data(portfolio2, start_date, end_date)
+    data1, stats1 = get_stock_data(portfolio1, start_date, end_date, data_provider, data_dir,
+                                   _progress=progress_reporter(progress_bar, 0, 50))
+    data2, stats2 = get_stock_data(portfolio2, start_date, end_date, data_provider, data_dir,
+                                   _progress=progress_reporter(progress_bar, 50, 50))
     
     progress_bar.empty()
     st.session_state.data_loaded = True
+    st.session_state.data_key = data_key
     st.session_state.data1 = data1
     st.session_state.stats1 = stats1
     st.session_state.data2 = data2
@@ -615,8 +720,7 @@ if not st.session_state.data_loaded:
         <div class="status-text success">✓ Stock data loaded successfully!</div>
     </div>
     """, unsafe_allow_html=True)
-    time.sleep(1)
-    st.rerun()
+    rerun()
 
 else:
     data1, stats1 = st.session_state.data1, st.session_state.stats1
@@ -644,6 +748,11 @@ if removed2:
     </div>
     """, unsafe_allow_html=True)
 
+# Results belong to one set of inputs; any change to them runs (or looks up) a fresh set
+results_key = simulation_key('portfolios', [portfolio1, portfolio2], data1, data2, num_simulations, seed)
+if st.session_state.get('results_key') != results_key:
+    st.session_state.simulations_run = False
+
 # Run simulations with loading state
 if not st.session_state.simulations_run:
     st.markdown("""
@@ -653,37 +762,24 @@ if not st.session_state.simulations_run:
     </div>
     """, unsafe_allow_html=True)
     
-    # Progress bar for simulations
+    # Progress bar for simulations, driven by simulations actually finished
     progress_bar = st.progress(0)
     status_text = st.empty()
     
-    for i in range(100):
-        time.sleep(0.02)
-        progress_bar.progress(i + 1)
-        if i < 50:
-            status_text.text(f"Running Portfolio 1 simulations... {i*2}%")
-        else:
-            status_text.text(f"Running Portfolio 2 simulations... {(i-50)*2}%")
-    
-    # Run actual simulations
-    avg1, std1, mean_ret1, std_ret1, mean_shp1, std_shp1, selections1 = run_multiple_simulations(
-        ThompsonSamplingStockTrader, portfolio1, data1, stats1, num_simulations, seed
-    )
-    avg2, std2, mean_ret2, std_ret2, mean_shp2, std_shp2, selections2 = run_multiple_simulations(
-        ThompsonSamplingStockTrader, portfolio2, data2, stats2, num_simulations, seed
-    )
+    # Both portfolios run in one vectorized sweep; the result objects keep the full path matrices
+    # so the risk dashboard below reads from this run instead of repeating it
+    result1, result2 = simulation_cache.get_or_run(results_key, lambda: run_portfolio_simulations(
+        [portfolio1, portfolio2], [data1, data2], [stats1, stats2], num_simulations, seed,
+        progress=progress_reporter(progress_bar, 0, 100, status_text, "Running portfolio simulations")
+    ))
     
     progress_bar.empty()
     status_text.empty()
     
     # Store results
     st.session_state.simulations_run = True
-    st.session_state.results = {
-        'avg1': avg1, 'std1': std1, 'mean_ret1': mean_ret1, 'std_ret1': std_ret1,
-        'mean_shp1': mean_shp1, 'std_shp1': std_shp1, 'selections1': selections1,
-        'avg2': avg2, 'std2': std2, 'mean_ret2': mean_ret2, 'std_ret2': std_ret2,
-        'mean_shp2': mean_shp2, 'std_shp2': std_shp2, 'selections2': selections2
-    }
+    st.session_state.results = {'result1': result1, 'result2': result2}
+    st.session_state.results_key = results_key
     
     # Success message
     st.markdown("""
@@ -691,19 +787,13 @@ if not st.session_state.simulations_run:
         <div class="status-text success">✓ Simulations completed successfully!</div>
     </div>
     """, unsafe_allow_html=True)
-    time.sleep(1)
-    st.rerun()
+    rerun()
 
 else:
     results = st.session_state.results
-    avg1, std1, mean_ret1, std_ret1, mean_shp1, std_shp1, selections1 = (
-        results['avg1'], results['std1'], results['mean_ret1'], results['std_ret1'],
-        results['mean_shp1'], results['std_shp1'], results['selections1']
-    )
-    avg2, std2, mean_ret2, std_ret2, mean_shp2, std_shp2, selections2 = (
-        results['avg2'], results['std2'], results['mean_ret2'], results['std_ret2'],
-        results['mean_shp2'], results['std_shp2'], results['selections2']
-    )
+    result1, result2 = results['result1'], results['result2']
+    avg1, std1, mean_ret1, std_ret1, mean_shp1, std_shp1, selections1 = result1.summary()
+    avg2, std2, mean_ret2, std_ret2, mean_shp2, std_shp2, selections2 = result2.summary()
 
 # Results container with proper nesting
 st.markdown("""
@@ -736,13 +826,16 @@ with col2:
     
     st.markdown("</div>", unsafe_allow_html=True)
 
+import altair as alt
+
 # Chart container with proper nesting
+charts.begin('portfolio_value')
 st.markdown("""
 <div class="content-container">
     <h2>Portfolio Value Over Time</h2>
 """, unsafe_allow_html=True)
 
-df_plot = pd.DataFrame({
+df_plot = downsample_frame(pd.DataFrame({
     'Day': np.arange(len(avg1)),
     'Large-cap (mean)': avg1,
     'Top Performers (mean)': avg2,
@@ -750,7 +843,7 @@ df_plot = pd.DataFrame({
     'Large-cap (high)': avg1 + std1,
     'Top Performers (low)': avg2 - std2,
     'Top Performers (high)': avg2 + std2
-})
+}), chart_points)
 
 # Enhanced Altair chart with better colors
 line_chart = alt.Chart(df_plot.reset_index()).transform_fold(
@@ -798,14 +891,15 @@ st.altair_chart(chart, use_container_width=True)
 st.markdown("</div>", unsafe_allow_html=True)
 
 # Selection frequency visualization with proper nesting
+charts.begin('selection_frequency')
 st.markdown("""
 <div class="content-container">
     <h2>Most Frequently Selected Stocks</h2>
 """, unsafe_allow_html=True)
 
 # Count selections
-sel_count1 = pd.Series(selections1).value_counts().sort_values(ascending=False)
-sel_count2 = pd.Series(selections2).value_counts().sort_values(ascending=False)
+sel_count1 = selections1.value_counts()
+sel_count2 = selections2.value_counts()
 # Top 10
 top1 = sel_count1.head(10).reset_index()
 top1.columns = ['Stock', 'Count']
@@ -861,6 +955,7 @@ with col2:
 st.markdown("</div>", unsafe_allow_html=True)
 
 # Sector Allocation Analysis
+charts.begin('sector_allocation')
 st.markdown("""
 <div class="content-container">
     <h2>Sector-wise Allocation Analysis</h2>
@@ -938,6 +1033,7 @@ with col2:
 st.markdown("</div>", unsafe_allow_html=True)
 
 # Benchmark Comparison Section
+charts.begin('benchmark_comparison')
 st.markdown("""
 <div class="content-container">
     <h2>Strategy Comparison</h2>
@@ -951,8 +1047,19 @@ st.markdown("""
 bh_values1, bh_return1, bh_sharpe1 = calculate_buy_and_hold_performance(valid_symbols1, data1)
 bh_values2, bh_return2, bh_sharpe2 = calculate_buy_and_hold_performance(valid_symbols2, data2)
 
-rs_values1, rs_return1, rs_sharpe1 = calculate_random_selection_performance(valid_symbols1, data1, seed=seed)
-rs_values2, rs_return2, rs_sharpe2 = calculate_random_selection_performance(valid_symbols2, data2, seed=seed)
+# Random selection runs as many seeds as Thompson Sampling, so it is shown as a
+# mean with a ±1 std band on the same scale
+rs_paths1, rs_paths2 = simulation_cache.get_or_run(
+    simulation_key('random_selection', [valid_symbols1, valid_symbols2], data1, data2, num_simulations, seed),
+    lambda: (simulate_random_selection(valid_symbols1, data1, num_simulations, seed=seed),
+             simulate_random_selection(valid_symbols2, data2, num_simulations, seed=seed))
+)
+rs_values1, rs_std1 = rs_paths1.mean(axis=0), rs_paths1.std(axis=0)
+rs_values2, rs_std2 = rs_paths2.mean(axis=0), rs_paths2.std(axis=0)
+rs_total1 = (rs_paths1[:, -1] / rs_paths1[:, 0] - 1) * 100
+rs_total2 = (rs_paths2[:, -1] / rs_paths2[:, 0] - 1) * 100
+rs_return1, rs_std_ret1 = rs_total1.mean(), rs_total1.std()
+rs_return2, rs_std_ret2 = rs_total2.mean(), rs_total2.std()
 
 # Benchmark comparison charts
 col1, col2 = st.columns(2)
@@ -965,15 +1072,19 @@ with col1:
     """, unsafe_allow_html=True)
     
     # Create comparison DataFrame
-    df_bench1 = pd.DataFrame({
+    df_bench1 = downsample_frame(pd.DataFrame({
         'Day': np.arange(len(avg1)),
         'Thompson Sampling': avg1,
         'Buy & Hold': bh_values1,
-        'Random Selection': rs_values1
-    })
+        'Random Selection': rs_values1,
+        'TS (low)': avg1 - std1,
+        'TS (high)': avg1 + std1,
+        'Random (low)': rs_values1 - rs_std1,
+        'Random (high)': rs_values1 + rs_std1
+    }), chart_points)
     
     # Create comparison chart
-    bench_chart1 = alt.Chart(df_bench1).transform_fold(
+    bench_lines1 = alt.Chart(df_bench1).transform_fold(
         ['Thompson Sampling', 'Buy & Hold', 'Random Selection'],
         as_=['Strategy', 'Value']
     ).mark_line(strokeWidth=2).encode(
@@ -984,7 +1095,19 @@ with col1:
                             domain=['Thompson Sampling', 'Buy & Hold', 'Random Selection'],
                             range=['#38bdf8', '#10b981', '#f59e0b'])),
         tooltip=['Day:Q', 'Strategy:N', 'Value:Q']
-    ).configure_axis(
+    )
+    
+    bench_bands1 = alt.Chart(df_bench1).mark_area(opacity=0.12, color='#38bdf8').encode(
+        x='Day:Q',
+        y='TS (low):Q',
+        y2='TS (high):Q'
+    ) + alt.Chart(df_bench1).mark_area(opacity=0.12, color='#f59e0b').encode(
+        x='Day:Q',
+        y='Random (low):Q',
+        y2='Random (high):Q'
+    )
+    
+    bench_chart1 = (bench_lines1 + bench_bands1).configure_axis(
         grid=True,
         gridColor='rgba(255, 255, 255, 0.1)',
         gridDash=[2, 2],
@@ -1001,7 +1124,7 @@ with col1:
     with col1b:
         st.metric("Buy & Hold", f"{bh_return1:.2f}%", "")
     with col1c:
-        st.metric("Random", f"{rs_return1:.2f}%", "")
+        st.metric("Random", f"{rs_return1:.2f}%", format_delta(f"±{rs_std_ret1:.2f}%"))
     
     st.markdown("</div>", unsafe_allow_html=True)
 
@@ -1013,15 +1136,19 @@ with col2:
     """, unsafe_allow_html=True)
     
     # Create comparison DataFrame
-    df_bench2 = pd.DataFrame({
+    df_bench2 = downsample_frame(pd.DataFrame({
         'Day': np.arange(len(avg2)),
         'Thompson Sampling': avg2,
         'Buy & Hold': bh_values2,
-        'Random Selection': rs_values2
-    })
+        'Random Selection': rs_values2,
+        'TS (low)': avg2 - std2,
+        'TS (high)': avg2 + std2,
+        'Random (low)': rs_values2 - rs_std2,
+        'Random (high)': rs_values2 + rs_std2
+    }), chart_points)
     
     # Create comparison chart
-    bench_chart2 = alt.Chart(df_bench2).transform_fold(
+    bench_lines2 = alt.Chart(df_bench2).transform_fold(
         ['Thompson Sampling', 'Buy & Hold', 'Random Selection'],
         as_=['Strategy', 'Value']
     ).mark_line(strokeWidth=2).encode(
@@ -1032,7 +1159,19 @@ with col2:
                             domain=['Thompson Sampling', 'Buy & Hold', 'Random Selection'],
                             range=['#a78bfa', '#10b981', '#f59e0b'])),
         tooltip=['Day:Q', 'Strategy:N', 'Value:Q']
-    ).configure_axis(
+    )
+    
+    bench_bands2 = alt.Chart(df_bench2).mark_area(opacity=0.12, color='#a78bfa').encode(
+        x='Day:Q',
+        y='TS (low):Q',
+        y2='TS (high):Q'
+    ) + alt.Chart(df_bench2).mark_area(opacity=0.12, color='#f59e0b').encode(
+        x='Day:Q',
+        y='Random (low):Q',
+        y2='Random (high):Q'
+    )
+    
+    bench_chart2 = (bench_lines2 + bench_bands2).configure_axis(
         grid=True,
         gridColor='rgba(255, 255, 255, 0.1)',
         gridDash=[2, 2],
@@ -1049,13 +1188,91 @@ with col2:
     with col2b:
         st.metric("Buy & Hold", f"{bh_return2:.2f}%", "")
     with col2c:
-        st.metric("Random", f"{rs_return2:.2f}%", "")
+        st.metric("Random", f"{rs_return2:.2f}%", format_delta(f"±{rs_std_ret2:.2f}%"))
     
     st.markdown("</div>", unsafe_allow_html=True)
 
 st.markdown("</div>", unsafe_allow_html=True)
 
+# Bandit Policy Comparison Section
+charts.begin('policy_comparison')
+st.markdown("""
+<div class="content-container">
+    <h2>Bandit Policy Comparison</h2>
+    <p style="color: #bae6fd; font-size: 1.1rem; margin-bottom: 2rem;">
+        Thompson Sampling against other bandit policies, all run in one batched pass on the same random draws
+    </p>
+</div>
+""", unsafe_allow_html=True)
+
+selected_policies = st.multiselect(
+    "Policies", list(POLICIES), default=list(POLICIES),
+    format_func=lambda name: POLICY_LABELS.get(name, name), key="policy_selection"
+)
+
+if st.button("Compare Policies", key="compare_policies") and selected_policies:
+    with st.spinner("Running policy comparison..."):
+        st.session_state.policy_results = simulation_cache.get_or_run(
+            simulation_key('policies', selected_policies, results_key),
+            lambda: {
+                'policy_results1': compare_policies(selected_policies, portfolio1, data1, stats1, num_simulations, seed),
+                'policy_results2': compare_policies(selected_policies, portfolio2, data2, stats2, num_simulations, seed)
+            }
+        )
+        st.session_state.policy_results_key = results_key
+
+# Comparisons run under other settings are not shown next to the current results
+if 'policy_results' in st.session_state and st.session_state.get('policy_results_key') == results_key:
+    col1, col2 = st.columns(2)
+    policy_columns = [
+        (col1, "Large-cap Portfolio", st.session_state.policy_results['policy_results1']),
+        (col2, "Top Performers Portfolio", st.session_state.policy_results['policy_results2'])
+    ]
+    for column, title, policy_results in policy_columns:
+        with column:
+            st.markdown(f"""
+            <div class="portfolio-section">
+                <h3>{title} - Policy Comparison</h3>
+            </div>
+            """, unsafe_allow_html=True)
+
+            rows = []
+            paths = {}
+            for name, result in policy_results.items():
+                _, policy_mean_risk, _ = calculate_batch_risk_metrics(result.portfolio_values)
+                label = POLICY_LABELS.get(name, name)
+                paths[label] = result.avg_portfolio
+                rows.append({
+                    'Policy': label,
+                    'Mean Return (%)': np.mean(result.total_returns),
+                    'Std Return (%)': np.std(result.total_returns),
+                    'Sharpe Ratio': np.mean(result.sharpe_ratios),
+                    'Max Drawdown (%)': policy_mean_risk['max_drawdown']
+                })
+
+            df_policies = pd.DataFrame(paths)
+            df_policies['Day'] = np.arange(len(df_policies))
+            df_policies = downsample_frame(df_policies, chart_points)
+            policy_chart = alt.Chart(df_policies).transform_fold(
+                list(paths), as_=['Policy', 'Value']
+            ).mark_line(strokeWidth=2).encode(
+                x=alt.X('Day:Q', title='Trading Day', axis=alt.Axis(labelColor='white', titleColor='white')),
+                y=alt.Y('Value:Q', title='Portfolio Value (Rs.)', axis=alt.Axis(labelColor='white', titleColor='white')),
+                color=alt.Color('Policy:N'),
+                tooltip=['Day:Q', 'Policy:N', 'Value:Q']
+            ).configure_axis(
+                grid=True,
+                gridColor='rgba(255, 255, 255, 0.1)',
+                gridDash=[2, 2],
+                labelColor='white',
+                titleColor='white'
+            ).configure_view(stroke=None)
+
+            st.altair_chart(policy_chart, use_container_width=True)
+            st.dataframe(pd.DataFrame(rows).set_index('Policy').round(2), use_container_width=True)
+
 # Risk Metrics Dashboard
+charts.begin('risk_dashboard')
 st.markdown("""
 <div class="content-container">
     <h2>Risk Analysis Dashboard</h2>
@@ -1067,25 +1284,9 @@ st.markdown("""
 
 # Calculate risk metrics for both portfolios
 if st.session_state.simulations_run:
-    # Get all portfolio values from simulations
-    all_portfolios1 = []
-    all_portfolios2 = []
-    
-    for i in range(num_simulations):
-        if seed is not None:
-            np.random.seed(seed + i)
-        
-        trader1 = ThompsonSamplingStockTrader(valid_symbols1, data1, stats1)
-        trader1.run()
-        all_portfolios1.append(trader1.portfolio_values)
-        
-        trader2 = ThompsonSamplingStockTrader(valid_symbols2, data2, stats2)
-        trader2.run()
-        all_portfolios2.append(trader2.portfolio_values)
-    
-    # Calculate risk metrics
-    risk_mean1, risk_std1 = calculate_portfolio_risk_metrics(all_portfolios1)
-    risk_mean2, risk_std2 = calculate_portfolio_risk_metrics(all_portfolios2)
+    # Calculate risk metrics for every stored simulation path at once
+    risk_all1, risk_mean1, risk_std1 = calculate_batch_risk_metrics(result1.portfolio_values)
+    risk_all2, risk_mean2, risk_std2 = calculate_batch_risk_metrics(result2.portfolio_values)
     
     # Risk metrics display
     col1, col2 = st.columns(2)
@@ -1132,6 +1333,42 @@ if st.session_state.simulations_run:
         
         st.markdown("</div>", unsafe_allow_html=True)
 
+    # Per-simulation distributions behind the mean ± std figures above
+    st.markdown("""
+    <div class="portfolio-section">
+        <h3>Risk Distribution Across Simulations</h3>
+    </div>
+    """, unsafe_allow_html=True)
+
+    df_risk = pd.concat([
+        pd.DataFrame({'Portfolio': 'Large-cap', 'Max Drawdown': risk_all1['max_drawdown'],
+                      'Sharpe Ratio': risk_all1['sharpe_ratio']}),
+        pd.DataFrame({'Portfolio': 'Top Performers', 'Max Drawdown': risk_all2['max_drawdown'],
+                      'Sharpe Ratio': risk_all2['sharpe_ratio']})
+    ], ignore_index=True)
+
+    col1, col2 = st.columns(2)
+    for column, metric, title in ((col1, 'Max Drawdown', 'Max Drawdown (%)'),
+                                  (col2, 'Sharpe Ratio', 'Sharpe Ratio')):
+        with column:
+            hist = alt.Chart(df_risk).mark_bar(opacity=0.6, binSpacing=0).encode(
+                x=alt.X(f'{metric}:Q', bin=alt.Bin(maxbins=30), title=title),
+                y=alt.Y('count():Q', stack=None, title='Simulations'),
+                color=alt.Color('Portfolio:N',
+                                scale=alt.Scale(
+                                    domain=['Large-cap', 'Top Performers'],
+                                    range=['#38bdf8', '#a78bfa'])),
+                tooltip=['Portfolio:N', 'count():Q']
+            ).configure_axis(
+                grid=True,
+                gridColor='rgba(255, 255, 255, 0.1)',
+                gridDash=[2, 2],
+                labelColor='white',
+                titleColor='white'
+            ).configure_view(stroke=None)
+
+            st.altair_chart(hist, use_container_width=True)
+
 # Risk metrics explanation
 st.markdown("""
 <div class="content-container">
@@ -1150,6 +1387,7 @@ st.markdown("""
 st.markdown("</div>", unsafe_allow_html=True)
 
 # Custom Portfolio Testing Section
+charts.begin('custom_portfolio')
 st.markdown("""
 <div class="content-container">
     <h2>Test Your Own Portfolio</h2>
@@ -1159,223 +1397,251 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-# Custom Portfolio Input Section
-st.markdown("""
-<div style="margin-bottom: 1rem;">
-    <p style="color: #bae6fd; font-size: 1rem; margin-bottom: 0.5rem; font-weight:700;">
-        Enter Stock Symbols (comma-separated):
-    </p>
-    <p style="color: #bae6fd; font-size: 0.9rem; margin-bottom: 1rem; opacity: 0.8;">
-        Example: RELIANCE.NS, TCS.NS, INFY.NS, HDFCBANK.NS
-    </p>
-</div>
-""", unsafe_allow_html=True)
-
-custom_symbols_input = st.text_area(
-    "Stock Symbols",
-    value="RELIANCE.NS, TCS.NS, INFY.NS, HDFCBANK.NS, ICICIBANK.NS, LT.NS, PIDILITIND.NS, CDSL.NS, AFFLE.NS, TATAELXSI.NS",
-    height=70,
-    label_visibility="collapsed",
-    placeholder="Enter stock symbols separated by commas..."
-)
-
-st.markdown("""
-<div style="margin-bottom: 1rem;">
-    <p style="color: #bae6fd; font-size: 1rem; margin-bottom: 0.5rem; font-weight:700;">
-        Note:
-    </p>
-    <p style="color: #bae6fd; font-size: 0.9rem; margin-bottom: 1rem; opacity: 0.8;">
-        We will compare your portfolio's real buy-and-hold return with Thompson Sampling.
-    </p>
-</div>
-""", unsafe_allow_html=True)
+# The custom portfolio section is a fragment: its widgets and button rerun only
+# this function, not the downloads, simulations and charts above it
+@st.fragment
+def custom_portfolio_section():
+    # Custom Portfolio Input Section
+    st.markdown("""
+    <div style="margin-bottom: 1rem;">
+        <p style="color: #bae6fd; font-size: 1rem; margin-bottom: 0.5rem; font-weight:700;">
+            Enter Stock Symbols (comma-separated):
+        </p>
+        <p style="color: #bae6fd; font-size: 0.9rem; margin-bottom: 1rem; opacity: 0.8;">
+            Example: RELIANCE.NS, TCS.NS, INFY.NS, HDFCBANK.NS
+        </p>
+    </div>
+    """, unsafe_allow_html=True)
 
-if st.button("Run Your Portfolio Analysis", key="custom_analysis"):
-    if custom_symbols_input.strip():
-        # Parse symbols
-        custom_symbols = [s.strip() for s in custom_symbols_input.split(',') if s.strip()]
-        
-    
-        if len(custom_symbols) > 0:
-            st.markdown("""
-            <div class="status-container loading">
-                <div class="loading-spinner"></div>
-                <div class="status-text loading">Analyzing your portfolio...</div>
-            </div>
-            """, unsafe_allow_html=True)
-            try:
-                custom_data, custom_stats = get_stock_data(custom_symbols, start_date, end_date)
-                valid_custom_symbols = [s for s in custom_symbols if s in custom_stats.index]
-                if len(valid_custom_symbols) > 0:
-                    avg_custom, std_custom, mean_ret_custom, std_ret_custom, mean_shp_custom, std_shp_custom, selections_custom = run_multiple_simulations(
-                        ThompsonSamplingStockTrader, valid_custom_symbols, custom_data, custom_stats, num_simulations, seed
-                    )
-                    # Calculate buy-and-hold return for custom portfolio
-                    bh_values_custom, bh_return_custom, bh_sharpe_custom = calculate_buy_and_hold_performance(valid_custom_symbols, custom_data)
-                    st.session_state.custom_results = {
-                        'avg': avg_custom, 'std': std_custom, 'mean_ret': mean_ret_custom, 'std_ret': std_ret_custom,
-                        'mean_shp': mean_shp_custom, 'std_shp': std_shp_custom, 'selections': selections_custom,
-                        'symbols': valid_custom_symbols, 'bh_return': bh_return_custom, 'bh_sharpe': bh_sharpe_custom,
-                        'bh_values': bh_values_custom
-                    }
-                    st.success("Your portfolio analysis completed!")
-                    st.rerun()
-                else:
-                    st.error("No valid stock symbols found. Please check your input.")
-            except Exception as e:
-                st.error(f"Error analyzing portfolio: {str(e)}")
-        else:
-            st.error("Please enter at least one stock symbol.")
-    else:
-        st.error("Please enter stock symbols.")
+    custom_symbols_input = st.text_area(
+        "Stock Symbols",
+        value="RELIANCE.NS, TCS.NS, INFY.NS, HDFCBANK.NS, ICICIBANK.NS, LT.NS, PIDILITIND.NS, CDSL.NS, AFFLE.NS, TATAELXSI.NS",
+        height=70,
+        label_visibility="collapsed",
+        placeholder="Enter stock symbols separated by commas..."
+    )
 
-# Display custom portfolio results if available
-if 'custom_results' in st.session_state:
-    custom_results = st.session_state.custom_results
     st.markdown("""
-    <div class="content-container">
-        <h2>Your Portfolio Results</h2>
+    <div style="margin-bottom: 1rem;">
+        <p style="color: #bae6fd; font-size: 1rem; margin-bottom: 0.5rem; font-weight:700;">
+            Note:
+        </p>
+        <p style="color: #bae6fd; font-size: 0.9rem; margin-bottom: 1rem; opacity: 0.8;">
+            We will compare your portfolio's real buy-and-hold return with Thompson Sampling.
+        </p>
     </div>
     """, unsafe_allow_html=True)
-    col1, col2 = st.columns(2)
-    with col1:
+
+    # Parse symbols
+    custom_symbols = [s.strip() for s in custom_symbols_input.split(',') if s.strip()]
+    # Earlier results are only shown while they were run on the current inputs
+    custom_key = simulation_key('custom_inputs', custom_symbols, start_date, end_date, data_provider, data_dir,
+                                num_simulations, seed)
+
+    if st.button("Run Your Portfolio Analysis", key="custom_analysis"):
+        if custom_symbols_input.strip():
+            if len(custom_symbols) > 0:
+                st.markdown("""
+                <div class="status-container loading">
+                    <div class="loading-spinner"></div>
+                    <div class="status-text loading">Analyzing your portfolio...</div>
+                </div>
+                """, unsafe_allow_html=True)
+                try:
+                    custom_data, custom_stats = get_stock_data(custom_symbols, start_date, end_date, data_provider, data_dir)
+                    valid_custom_symbols = [s for s in custom_symbols if s in custom_stats.index]
+                    if len(valid_custom_symbols) > 0:
+                        avg_custom, std_custom, mean_ret_custom, std_ret_custom, mean_shp_custom, std_shp_custom, selections_custom = simulation_cache.get_or_run(
+                            simulation_key('custom_portfolio', valid_custom_symbols, custom_data, num_simulations, seed),
+                            lambda: run_multiple_simulations(
+                                ThompsonSamplingStockTrader, valid_custom_symbols, custom_data, custom_stats, num_simulations, seed
+                            )
+                        )
+                        # Calculate buy-and-hold return for custom portfolio
+                        bh_values_custom, bh_return_custom, bh_sharpe_custom = calculate_buy_and_hold_performance(valid_custom_symbols, custom_data)
+                        st.session_state.custom_results = {
+                            'avg': avg_custom, 'std': std_custom, 'mean_ret': mean_ret_custom, 'std_ret': std_ret_custom,
+                            'mean_shp': mean_shp_custom, 'std_shp': std_shp_custom, 'selections': selections_custom,
+                            'symbols': valid_custom_symbols, 'bh_return': bh_return_custom, 'bh_sharpe': bh_sharpe_custom,
+                            'bh_values': bh_values_custom, 'num_simulations': num_simulations
+                        }
+                        st.session_state.custom_results_key = custom_key
+                        st.success("Your portfolio analysis completed!")
+                    else:
+                        st.error("No valid stock symbols found. Please check your input.")
+                except Exception as e:
+                    st.error(f"Error analyzing portfolio: {str(e)}")
+            else:
+                st.error("Please enter at least one stock symbol.")
+        else:
+            st.error("Please enter stock symbols.")
+
+    # Display custom portfolio results if available
+    if 'custom_results' in st.session_state and st.session_state.get('custom_results_key') == custom_key:
+        custom_results = st.session_state.custom_results
         st.markdown("""
-        <div class="portfolio-section">
-            <h3>Thompson Sampling Performance</h3>
+        <div class="content-container">
+            <h2>Your Portfolio Results</h2>
         </div>
         """, unsafe_allow_html=True)
-        st.metric("Mean Total Return", f"{custom_results['mean_ret']:.2f}%", format_delta(f"±{custom_results['std_ret']:.2f}%"))
-        st.metric("Mean Sharpe Ratio", f"{custom_results['mean_shp']:.2f}", format_delta(f"±{custom_results['std_shp']:.2f}"))
-        st.metric("Stocks Analyzed", len(custom_results['symbols']), "")
-        st.markdown("</div>", unsafe_allow_html=True)
-    with col2:
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("""
+            <div class="portfolio-section">
+                <h3>Thompson Sampling Performance</h3>
+            </div>
+            """, unsafe_allow_html=True)
+            st.metric("Mean Total Return", f"{custom_results['mean_ret']:.2f}%", format_delta(f"±{custom_results['std_ret']:.2f}%"))
+            st.metric("Mean Sharpe Ratio", f"{custom_results['mean_shp']:.2f}", format_delta(f"±{custom_results['std_shp']:.2f}"))
+            st.metric("Stocks Analyzed", len(custom_results['symbols']), "")
+            st.markdown("</div>", unsafe_allow_html=True)
+        with col2:
+            st.markdown("""
+            <div class="portfolio-section">
+                <h3>Buy & Hold Performance</h3>
+            </div>
+            """, unsafe_allow_html=True)
+            st.metric("Total Return", f"{custom_results['bh_return']:.2f}%")
+            delta_value = custom_results['bh_return'] - custom_results['mean_ret']
+            if delta_value > 0:
+                st.markdown(
+                    f'<span style="color:#16a34a; font-size:1rem; font-weight:700; margin-top:-0.5rem; display:block;">Better ({delta_value:.2f}%)</span>',
+                    unsafe_allow_html=True
+                )
+            else:
+                st.markdown(
+                    f'<span style="color:#ef4444; font-size:1rem; font-weight:700; margin-top:-0.5rem; display:block;">Worse ({delta_value:.2f}%)</span>',
+                    unsafe_allow_html=True
+                )
+            st.metric("Sharpe Ratio", f"{custom_results['bh_sharpe']:.2f}")
+            st.metric("Simulations Run", custom_results['num_simulations'], "")
+            st.markdown("</div>", unsafe_allow_html=True)
+
+    
+        # Custom portfolio performance chart
         st.markdown("""
-        <div class="portfolio-section">
-            <h3>Buy & Hold Performance</h3>
+        <div class="content-container">
+            <h2>Your Portfolio Performance</h2>
         </div>
         """, unsafe_allow_html=True)
-        st.metric("Total Return", f"{custom_results['bh_return']:.2f}%")
-        delta_value = custom_results['bh_return'] - custom_results['mean_ret']
-        if delta_value > 0:
-            st.markdown(
-                f'<span style="color:#16a34a; font-size:1rem; font-weight:700; margin-top:-0.5rem; display:block;">Better ({delta_value:.2f}%)</span>',
-                unsafe_allow_html=True
-            )
-        else:
-            st.markdown(
-                f'<span style="color:#ef4444; font-size:1rem; font-weight:700; margin-top:-0.5rem; display:block;">Worse ({delta_value:.2f}%)</span>',
-                unsafe_allow_html=True
-            )
-        st.metric("Sharpe Ratio", f"{custom_results['bh_sharpe']:.2f}")
-        st.metric("Simulations Run", num_simulations, "")
-        st.markdown("</div>", unsafe_allow_html=True)
-
     
-    # Custom portfolio performance chart
-    st.markdown("""
-    <div class="content-container">
-        <h2>Your Portfolio Performance</h2>
-    </div>
-    """, unsafe_allow_html=True)
-    
-    df_custom_plot = pd.DataFrame({
-        'Day': np.arange(len(custom_results['avg'])),
-        'Thompson Sampling': custom_results['avg'],
-        'Lower Bound': custom_results['avg'] - custom_results['std'],
-        'Upper Bound': custom_results['avg'] + custom_results['std'],
-        'Buy & Hold': custom_results.get('bh_values', custom_results['avg'])
-    })
-    
-    # Create chart with existing styling
-    custom_line_chart = alt.Chart(df_custom_plot).transform_fold(
-        ['Thompson Sampling', 'Buy & Hold'],
-        as_=['Strategy', 'Value']
-    ).mark_line(strokeWidth=3).encode(
-        x=alt.X('Day:Q', title='Trading Day', axis=alt.Axis(labelColor='white', titleColor='white')),
-        y=alt.Y('Value:Q', title='Portfolio Value (Rs.)', axis=alt.Axis(labelColor='white', titleColor='white')),
-        color=alt.Color('Strategy:N',
-                        scale=alt.Scale(
-                            domain=['Thompson Sampling', 'Buy & Hold'],
-                            range=['#10b981', '#f59e0b'])),
-        tooltip=['Day:Q', 'Strategy:N', 'Value:Q']
-    )
+        df_custom_plot = downsample_frame(pd.DataFrame({
+            'Day': np.arange(len(custom_results['avg'])),
+            'Thompson Sampling': custom_results['avg'],
+            'Lower Bound': custom_results['avg'] - custom_results['std'],
+            'Upper Bound': custom_results['avg'] + custom_results['std'],
+            'Buy & Hold': custom_results.get('bh_values', custom_results['avg'])
+        }), chart_points)
+    
+        # Create chart with existing styling
+        custom_line_chart = alt.Chart(df_custom_plot).transform_fold(
+            ['Thompson Sampling', 'Buy & Hold'],
+            as_=['Strategy', 'Value']
+        ).mark_line(strokeWidth=3).encode(
+            x=alt.X('Day:Q', title='Trading Day', axis=alt.Axis(labelColor='white', titleColor='white')),
+            y=alt.Y('Value:Q', title='Portfolio Value (Rs.)', axis=alt.Axis(labelColor='white', titleColor='white')),
+            color=alt.Color('Strategy:N',
+                            scale=alt.Scale(
+                                domain=['Thompson Sampling', 'Buy & Hold'],
+                                range=['#10b981', '#f59e0b'])),
+            tooltip=['Day:Q', 'Strategy:N', 'Value:Q']
+        )
     
-    custom_band = alt.Chart(df_custom_plot).mark_area(opacity=0.12, color='#10b981').encode(
-        x='Day:Q',
-        y='Lower Bound:Q',
-        y2='Upper Bound:Q'
-    )
+        custom_band = alt.Chart(df_custom_plot).mark_area(opacity=0.12, color='#10b981').encode(
+            x='Day:Q',
+            y='Lower Bound:Q',
+            y2='Upper Bound:Q'
+        )
     
-    custom_chart = (custom_line_chart + custom_band).interactive().configure_axis(
-        grid=True,
-        gridColor='rgba(255, 255, 255, 0.1)',
-        gridDash=[2, 2],
-        labelColor='white',
-        titleColor='white'
-    ).configure_view(stroke=None)
+        custom_chart = (custom_line_chart + custom_band).interactive().configure_axis(
+            grid=True,
+            gridColor='rgba(255, 255, 255, 0.1)',
+            gridDash=[2, 2],
+            labelColor='white',
+            titleColor='white'
+        ).configure_view(stroke=None)
     
-    st.altair_chart(custom_chart, use_container_width=True)
+        st.altair_chart(custom_chart, use_container_width=True)
     
-    st.markdown("</div>", unsafe_allow_html=True)
+        st.markdown("</div>", unsafe_allow_html=True)
     
-    # Custom portfolio stock selections
-    st.markdown("""
-    <div class="content-container">
-        <h2>Most Selected Stocks in Your Portfolio</h2>
-    </div>
-    """, unsafe_allow_html=True)
+        # Custom portfolio stock selections
+        st.markdown("""
+        <div class="content-container">
+            <h2>Most Selected Stocks in Your Portfolio</h2>
+        </div>
+        """, unsafe_allow_html=True)
     
-    sel_count_custom = pd.Series(custom_results['selections']).value_counts().sort_values(ascending=False)
-    top_custom = sel_count_custom.head(10).reset_index()
-    top_custom.columns = ['Stock', 'Count']
+        sel_count_custom = custom_results['selections'].value_counts()
+        top_custom = sel_count_custom.head(10).reset_index()
+        top_custom.columns = ['Stock', 'Count']
     
-    custom_bar = alt.Chart(top_custom).mark_bar(color='#10b981').encode(
-        x=alt.X('Count:Q', title='Selection Count'),
-        y=alt.Y('Stock:N', sort='-x', title='Stock Symbol'),
-        tooltip=['Stock:N', 'Count:Q']
-    ).configure_axis(
-        grid=True,
-        gridColor='rgba(255, 255, 255, 0.1)',
-        labelColor='white',
-        titleColor='white'
-    ).configure_view(stroke=None)
+        custom_bar = alt.Chart(top_custom).mark_bar(color='#10b981').encode(
+            x=alt.X('Count:Q', title='Selection Count'),
+            y=alt.Y('Stock:N', sort='-x', title='Stock Symbol'),
+            tooltip=['Stock:N', 'Count:Q']
+        ).configure_axis(
+            grid=True,
+            gridColor='rgba(255, 255, 255, 0.1)',
+            labelColor='white',
+            titleColor='white'
+        ).configure_view(stroke=None)
     
-    st.altair_chart(custom_bar, use_container_width=True)
+        st.altair_chart(custom_bar, use_container_width=True)
     
-    st.markdown("</div>", unsafe_allow_html=True)
+        st.markdown("</div>", unsafe_allow_html=True)
     
-    # Custom portfolio sector allocation
-    if len(custom_results['symbols']) > 0:
-        st.markdown("""
-        <div class="content-container">
-            <h2>Sector Allocation in Your Portfolio</h2>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        sector_alloc_custom = get_sector_allocation(custom_results['selections'], custom_results['symbols'])
-        sector_df_custom = pd.DataFrame(list(sector_alloc_custom.items()), columns=['Sector', 'Allocation'])
-        
-        if not sector_df_custom.empty:
-            custom_pie = alt.Chart(sector_df_custom).mark_arc().encode(
-                theta=alt.Theta('Allocation:Q', type='quantitative'),
-                color=alt.Color('Sector:N', scale=alt.Scale(scheme='category10')),
-                tooltip=['Sector:N', alt.Tooltip('Allocation:Q', format='.1f')]
-            ).configure_view(
-                stroke=None
-            ).configure_axis(
-                labelColor='white',
-                titleColor='white'
-            )
-            
-            st.altair_chart(custom_pie, use_container_width=True)
-        else:
+        # Custom portfolio sector allocation
+        if len(custom_results['symbols']) > 0:
             st.markdown("""
-            <div style="text-align: center; padding: 2rem; color: #bae6fd; opacity: 0.8;">
-                <p>No sector data available for this portfolio</p>
+            <div class="content-container">
+                <h2>Sector Allocation in Your Portfolio</h2>
             </div>
             """, unsafe_allow_html=True)
         
-        st.markdown("</div>", unsafe_allow_html=True)
+            sector_alloc_custom = get_sector_allocation(custom_results['selections'], custom_results['symbols'])
+            sector_df_custom = pd.DataFrame(list(sector_alloc_custom.items()), columns=['Sector', 'Allocation'])
+        
+            if not sector_df_custom.empty:
+                custom_pie = alt.Chart(sector_df_custom).mark_arc().encode(
+                    theta=alt.Theta('Allocation:Q', type='quantitative'),
+                    color=alt.Color('Sector:N', scale=alt.Scale(scheme='category10')),
+                    tooltip=['Sector:N', alt.Tooltip('Allocation:Q', format='.1f')]
+                ).configure_view(
+                    stroke=None
+                ).configure_axis(
+                    labelColor='white',
+                    titleColor='white'
+                )
+            
+                st.altair_chart(custom_pie, use_container_width=True)
+            else:
+                st.markdown("""
+                <div style="text-align: center; padding: 2rem; color: #bae6fd; opacity: 0.8;">
+                    <p>No sector data available for this portfolio</p>
+                </div>
+                """, unsafe_allow_html=True)
+        
+            st.markdown("</div>", unsafe_allow_html=True)
+
+
+custom_portfolio_section()
+
+charts.end()
+perf_report.stop()
+
+with performance_panel:
+    if perf_report.spans:
+        spans = pd.DataFrame(perf_report.spans)
+        spans['stage'] = ['\u2003' * depth + stage for depth, stage in zip(spans['depth'], spans['stage'])]
+        st.dataframe(spans[['stage', 'seconds']].set_index('stage').round(4), use_container_width=True)
+        st.caption(f"Total {perf_report.total_seconds:.2f}s across {int((spans['depth'] == 0).sum())} top-level stages")
+    if perf_report.hot_functions:
+        st.markdown("**Hot functions** (by cumulative time)")
+        st.dataframe(pd.DataFrame(perf_report.hot_functions).set_index('function').round(4), use_container_width=True)
+    if perf_report.allocations:
+        st.markdown(f"**Allocation sites** (peak traced {perf_report.peak_memory_bytes / 2 ** 20:.1f} MiB)")
+        st.dataframe(pd.DataFrame(perf_report.allocations).set_index('location'), use_container_width=True)
 
 st.markdown("""
 <div class="content-container" style="margin-top: 3rem; text-align: center; padding: 1rem;">
@@ -0,0 +1,222 @@
+"""Benchmarks for the trader, simulation runner, risk metrics and baselines
+
+Runs on synthetic_market prices with no network access. For every point of a grid
+over simulations x symbols x days it records wall time, peak traced memory
+and throughput in simulation-steps per second, and writes the results as
+JSON so a run can be compared against a stored baseline:
+
+    python benchmarks.py --output bench.json
+    python benchmarks.py --full --baseline bench.json
+
+``--imports`` adds a startup report: the cold import time of the app's
+modules measured with ``python -X importtime`` in fresh interpreters.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from synthetic_market import generate_market
+from thompson_trader import (
+    ThompsonSamplingStockTrader,
+    run_multiple_simulations,
+    calculate_portfolio_risk_metrics,
+    calculate_buy_and_hold_performance,
+    calculate_random_selection_performance
+)
+
+QUICK_GRID = {'simulations': [10, 100], 'symbols': [5, 50], 'days': [250, 1000]}
+FULL_GRID = {'simulations': [10, 100, 1000, 10000], 'symbols': [5, 50, 500, 5000], 'days': [250, 2500, 10000]}
+IMPORT_MODULES = ['policies', 'market_data', 'thompson_trader', 'streamlit', 'altair']
+
+
+def measure(func, repeat=3):
+    """Best wall time over repeat calls, plus peak traced memory of one extra call"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(timings), peak
+
+
+def benchmark_cases(num_simulations, num_symbols, num_days, close_data, stats, paths):
+    """(name, runs every simulation, callable) for each benchmarked function at one grid point"""
+    symbols = list(stats.index)
+    return [
+        ('trader_run', False,
+         lambda: ThompsonSamplingStockTrader(symbols, close_data, stats).run()),
+        ('run_multiple_simulations', True,
+         lambda: run_multiple_simulations(ThompsonSamplingStockTrader, symbols, close_data, stats,
+                                          num_simulations, seed=0)),
+        ('calculate_portfolio_risk_metrics', True,
+         lambda: calculate_portfolio_risk_metrics(paths)),
+        ('buy_and_hold', False,
+         lambda: calculate_buy_and_hold_performance(symbols, close_data)),
+        ('random_selection', False,
+         lambda: calculate_random_selection_performance(symbols, close_data, seed=0)),
+    ]
+
+
+def measure_import(module, repeat=3, top=5):
+    """Cold import time of module in a fresh interpreter, from ``-X importtime`` output
+
+    Keeps the fastest of repeat runs and the top modules by cumulative time
+    within it, so a slow transitive dependency shows up by name.
+    """
+    best = None
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                   capture_output=True, text=True, check=True)
+        entries = []
+        for line in completed.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            # Two spaces of indent per nesting level below the imported module
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            entries.append((name.strip(), depth, int(cumulative) / 1e6))
+        # Entries print as each import finishes, so the module comes last and
+        # its direct dependencies are the depth-1 entries since interpreter startup
+        start = max((i for i, entry in enumerate(entries) if entry[1] == 0 and entry[0] != module), default=-1)
+        children = [(name, seconds) for name, depth, seconds in entries[start + 1:] if depth == 1]
+        total = entries[-1][2]
+        if best is None or total < best[0]:
+            best = (total, children)
+
+    total, children = best
+    heaviest = sorted(children, key=lambda e: -e[1])[:top]
+    result = {
+        'module': module,
+        'import_time': total,
+        'heaviest': [{'module': name, 'import_time': seconds} for name, seconds in heaviest]
+    }
+    print(f"import {module:30s} {total * 1000:10.2f} ms  "
+          + ', '.join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in heaviest))
+    return result
+
+
+def run_benchmarks(grid, max_cells=2e8, repeat=3, only=None):
+    """Run every benchmark over the grid, skipping points whose sims x symbols x days exceed max_cells"""
+    results = []
+    for num_symbols in grid['symbols']:
+        for num_days in grid['days']:
+            if num_symbols * num_days > max_cells:
+                continue
+            close_data, stats = generate_market(num_symbols, num_days + 1, seed=0)
+            for num_simulations in grid['simulations']:
+                if num_simulations * num_symbols * num_days > max_cells:
+                    continue
+                rng = np.random.default_rng(0)
+                paths = 100000 * np.cumprod(1 + rng.normal(0.0005, 0.02, (num_simulations, num_days + 1)), axis=1)
+
+                for name, per_simulation, func in benchmark_cases(num_simulations, num_symbols, num_days,
+                                                                  close_data, stats, paths):
+                    if only and name not in only:
+                        continue
+                    # Single-path benchmarks do not depend on the simulation count
+                    if not per_simulation and num_simulations != grid['simulations'][0]:
+                        continue
+                    simulations = num_simulations if per_simulation else 1
+                    steps = simulations * num_days
+                    wall_time, peak = measure(func, repeat)
+                    result = {
+                        'benchmark': name,
+                        'simulations': simulations,
+                        'symbols': num_symbols,
+                        'days': num_days,
+                        'wall_time': wall_time,
+                        'peak_memory_bytes': peak,
+                        'steps_per_second': steps / wall_time if wall_time > 0 else float('inf')
+                    }
+                    results.append(result)
+                    print(f"{name:34s} sims={result['simulations']:<6d} symbols={num_symbols:<5d} "
+                          f"days={num_days:<6d} {wall_time * 1000:10.2f} ms "
+                          f"{peak / 2 ** 20:9.1f} MiB {result['steps_per_second']:14.0f} steps/s")
+    return results
+
+
+def result_key(result):
+    return (result['benchmark'], result['simulations'], result['symbols'], result['days'])
+
+
+def compare_to_baseline(results, baseline, threshold=0.1):
+    """Print the wall-time ratio against a baseline run; returns the number of regressions"""
+    previous = {result_key(r): r for r in baseline['results']}
+    regressions = 0
+    print("\nComparison with baseline (current / baseline wall time):")
+    for result in results:
+        before = previous.get(result_key(result))
+        if before is None:
+            continue
+        ratio = result['wall_time'] / before['wall_time']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        elif ratio < 1 - threshold:
+            flag = '  faster'
+        print(f"{result['benchmark']:34s} sims={result['simulations']:<6d} symbols={result['symbols']:<5d} "
+              f"days={result['days']:<6d} x{ratio:6.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--full', action='store_true', help='use the full 10-10,000 sims / 5-5,000 symbols / 250-10,000 days grid')
+    parser.add_argument('--simulations', type=int, nargs='+', help='override the simulation counts')
+    parser.add_argument('--symbols', type=int, nargs='+', help='override the symbol counts')
+    parser.add_argument('--days', type=int, nargs='+', help='override the day counts')
+    parser.add_argument('--max-cells', type=float, default=2e8, help='skip points above this sims x symbols x days')
+    parser.add_argument('--repeat', type=int, default=3, help='timed repetitions per point (best is kept)')
+    parser.add_argument('--only', nargs='+', help='run only these benchmarks')
+    parser.add_argument('--imports', action='store_true', help='also report cold import times of the app modules')
+    parser.add_argument('--output', help='write results JSON here')
+    parser.add_argument('--baseline', help='compare against a previous results JSON')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown reported as a regression')
+    args = parser.parse_args(argv)
+
+    grid = dict(FULL_GRID if args.full else QUICK_GRID)
+    for axis in grid:
+        if getattr(args, axis):
+            grid[axis] = getattr(args, axis)
+
+    results = run_benchmarks(grid, args.max_cells, args.repeat, args.only)
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'grid': grid,
+        'results': results
+    }
+    if args.imports:
+        report['imports'] = [measure_import(module, args.repeat) for module in IMPORT_MODULES]
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        return 1 if compare_to_baseline(results, baseline, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,173 @@
+"""Stage timing spans and optional profiling for a single run
+
+Library code wraps each stage in ``span('stage')``. Every finished span is
+written as one JSON log line on the ``thompson_trader.timing`` logger and,
+when a PerformanceReport is active, collected into that report:
+
+    report = PerformanceReport()
+    with report.activate():
+        download_and_prepare_data(...)
+        run_multiple_simulations(...)
+    report.spans    # [{'stage': ..., 'depth': ..., 'seconds': ...}, ...] in start order
+
+SectionTimer times consecutive sections of a script such as the Streamlit
+page without wrapping each one in a with block.
+
+``PerformanceReport(profile=True, memory=True)`` also runs cProfile and
+tracemalloc while it is active and keeps their hot-function and
+allocation-site tables.
+"""
+import cProfile
+import json
+import logging
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger('thompson_trader.timing')
+
+_active_report = ContextVar('active_report', default=None)
+_span_depth = ContextVar('span_depth', default=0)
+# The report capturing on each thread; a capture left running by an interrupted
+# run is stopped before the next one on that thread starts
+_capturing = threading.local()
+
+
+@contextmanager
+def span(stage, **fields):
+    """Time the enclosed block as one stage; extra fields go into the report and the log line"""
+    depth = _span_depth.get()
+    entry = {'stage': stage, 'depth': depth, 'seconds': None, **fields}
+    report = _active_report.get()
+    if report is not None:
+        report.spans.append(entry)
+    token = _span_depth.set(depth + 1)
+    start = time.perf_counter()
+    try:
+        yield entry
+    finally:
+        entry['seconds'] = time.perf_counter() - start
+        _span_depth.reset(token)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({'event': 'span', **entry}, default=str))
+
+
+class SectionTimer:
+    """Back-to-back spans for top-to-bottom scripts: each begin() ends the previous section"""
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self._open = ExitStack()
+
+    def begin(self, stage, **fields):
+        self.end()
+        self._open.enter_context(span(self.prefix + stage, **fields))
+
+    def end(self):
+        self._open.close()
+
+
+def enable_timing_log(stream=None, level=logging.INFO):
+    """Send the span log lines to stream (stderr by default) unless a handler is already attached"""
+    if not logger.handlers:
+        handler = logging.StreamHandler(stream or sys.stderr)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(message)s'))
+        logger.addHandler(handler)
+    logger.setLevel(level)
+
+
+def hot_functions(profiler, top=20):
+    """Top functions of a cProfile run by cumulative time"""
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, name), (_, calls, total, cumulative, _) in stats.stats.items():
+        rows.append({
+            'function': f'{name} ({filename}:{line})',
+            'calls': calls,
+            'total_seconds': total,
+            'cumulative_seconds': cumulative
+        })
+    rows.sort(key=lambda row: -row['cumulative_seconds'])
+    return rows[:top]
+
+
+def top_allocations(snapshot, top=20):
+    """Source lines holding the most traced memory in a tracemalloc snapshot"""
+    return [
+        {'location': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}',
+         'size_bytes': stat.size,
+         'blocks': stat.count}
+        for stat in snapshot.statistics('lineno')[:top]
+    ]
+
+
+class PerformanceReport:
+    """Timing spans of one run, plus cProfile and tracemalloc tables when requested
+
+    start() and stop() may be called repeatedly, for example across the
+    reruns of a Streamlit page: spans keep accumulating, and the profiler
+    statistics cover every interval the report was active.
+    """
+
+    def __init__(self, profile=False, memory=False, top=20):
+        self.profile = profile
+        self.memory = memory
+        self.top = top
+        self.spans = []
+        self.hot_functions = []
+        self.allocations = []
+        self.peak_memory_bytes = None
+        self._profiler = cProfile.Profile() if profile else None
+        self._token = None
+        self._started_tracing = False
+
+    def start(self):
+        previous = getattr(_capturing, 'report', None)
+        if previous is not None:
+            previous.stop()
+        self._token = _active_report.set(self)
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        if self._profiler is not None:
+            self._profiler.enable()
+        _capturing.report = self
+        return self
+
+    def stop(self):
+        if getattr(_capturing, 'report', None) is not self:
+            return self
+        if self._profiler is not None:
+            self._profiler.disable()
+            self.hot_functions = hot_functions(self._profiler, self.top)
+        if self.memory and tracemalloc.is_tracing():
+            self.allocations = top_allocations(tracemalloc.take_snapshot(), self.top)
+            peak = tracemalloc.get_traced_memory()[1]
+            self.peak_memory_bytes = max(peak, self.peak_memory_bytes or 0)
+            if self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+        try:
+            _active_report.reset(self._token)
+        except ValueError:
+            # Stopped from a different context than it was started in
+            _active_report.set(None)
+        _capturing.report = None
+        return self
+
+    @contextmanager
+    def activate(self):
+        self.start()
+        try:
+            yield self
+        finally:
+            self.stop()
+
+    @property
+    def total_seconds(self):
+        """Wall time of the finished top-level spans"""
+        return sum(entry['seconds'] for entry in self.spans if entry['depth'] == 0 and entry['seconds'] is not None)
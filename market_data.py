@@ -0,0 +1,303 @@
+import os
+import tempfile
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from synthetic_market import generate_market
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'thompson_trader', 'prices')
+DEFAULT_PROVIDER = 'yahoo'
+
+
+def download_close(symbols, start_date, end_date):
+    """Download close prices from Yahoo Finance as a date x symbol DataFrame"""
+    # yfinance pulls in requests, lxml and more, so it is only loaded for downloads
+    import yfinance as yf
+
+    data = yf.download(symbols, start=start_date, end=end_date, progress=False, group_by='ticker')
+
+    if isinstance(data.columns, pd.MultiIndex):
+        close_data = pd.concat([data[ticker]['Close'].rename(ticker)
+                                for ticker in data.columns.levels[0]
+                                if 'Close' in data[ticker]], axis=1)
+    else:
+        close_data = data if 'Close' in data else pd.DataFrame()
+
+    return close_data
+
+
+class MarketDataProvider:
+    """Source of close prices that download_and_prepare_data dispatches to"""
+    name = None
+
+    def get_close(self, symbols, start_date, end_date, progress=None):
+        """Close prices for symbols over [start_date, end_date) as a date x symbol DataFrame
+
+        ``progress``, if given, is called as progress(symbols_done, symbols_total)
+        as symbols finish loading.
+        """
+        raise NotImplementedError
+
+
+class YahooFinanceProvider(MarketDataProvider):
+    """Close prices downloaded from Yahoo Finance
+
+    Symbols are requested chunk_size at a time, and progress is reported
+    after each chunk. One batch download reports nothing until it finishes,
+    so smaller chunks give a smoother progress bar at the cost of more
+    requests.
+    """
+    name = 'yahoo'
+
+    def __init__(self, chunk_size=10):
+        self.chunk_size = max(int(chunk_size), 1)
+
+    def get_close(self, symbols, start_date, end_date, progress=None):
+        symbols = list(dict.fromkeys(symbols))
+        chunks = []
+        for start in range(0, len(symbols), self.chunk_size):
+            chunk = symbols[start:start + self.chunk_size]
+            chunks.append(download_close(chunk, start_date, end_date))
+            if progress is not None:
+                progress(start + len(chunk), len(symbols))
+        chunks = [chunk for chunk in chunks if not chunk.empty]
+        if not chunks:
+            return pd.DataFrame()
+        return pd.concat(chunks, axis=1).sort_index()
+
+
+class DirectoryProvider(MarketDataProvider):
+    """Close prices read from a local directory, for offline and air-gapped runs
+
+    Two layouts are supported. Per-symbol ``<SYMBOL>.parquet`` or
+    ``<SYMBOL>.csv`` files with a date column and a close column, where Parquet
+    files are memory-mapped while reading. Or a wide ``close.npy`` (days x
+    symbols) matrix with ``dates.npy`` and ``symbols.txt`` alongside, which is
+    memory-mapped so only the requested columns and dates are ever copied.
+    """
+    name = 'directory'
+
+    def __init__(self, path=None, date_column='Date', close_column='Close'):
+        self.path = path or os.environ.get('THOMPSON_DATA_DIR', '.')
+        self.date_column = date_column
+        self.close_column = close_column
+        self._matrix = None
+
+    def _wide_matrix(self):
+        if self._matrix is None:
+            matrix_path = os.path.join(self.path, 'close.npy')
+            if not os.path.exists(matrix_path):
+                self._matrix = False
+            else:
+                with open(os.path.join(self.path, 'symbols.txt')) as f:
+                    columns = {line.strip(): i for i, line in enumerate(f) if line.strip()}
+                dates = pd.DatetimeIndex(np.load(os.path.join(self.path, 'dates.npy')))
+                self._matrix = (np.load(matrix_path, mmap_mode='r'), dates, columns)
+        return self._matrix
+
+    def _read_symbol(self, symbol):
+        stem = os.path.join(self.path, symbol.replace(os.sep, '_'))
+        columns = [self.date_column, self.close_column]
+        if os.path.exists(stem + '.parquet'):
+            frame = pd.read_parquet(stem + '.parquet', columns=columns, memory_map=True)
+        elif os.path.exists(stem + '.csv'):
+            frame = pd.read_csv(stem + '.csv', usecols=columns)
+        else:
+            return None
+        dates = pd.DatetimeIndex(pd.to_datetime(frame[self.date_column])).tz_localize(None)
+        return pd.Series(frame[self.close_column].to_numpy(dtype=np.float64), index=dates, name=symbol)
+
+    def get_close(self, symbols, start_date, end_date, progress=None):
+        start = pd.Timestamp(start_date)
+        end = pd.Timestamp(end_date)
+        requested = list(symbols)
+        columns = []
+        done = 0
+
+        matrix = self._wide_matrix()
+        if matrix:
+            close, dates, positions = matrix
+            rows = slice(dates.searchsorted(start), dates.searchsorted(end))
+            wide_symbols = [s for s in symbols if s in positions]
+            if wide_symbols:
+                block = close[rows, [positions[s] for s in wide_symbols]]
+                columns.append(pd.DataFrame(block, index=dates[rows], columns=wide_symbols))
+                done += len(wide_symbols)
+                if progress is not None:
+                    progress(done, len(requested))
+            symbols = [s for s in symbols if s not in positions]
+
+        for symbol in symbols:
+            series = self._read_symbol(symbol)
+            if series is not None:
+                columns.append(series[(series.index >= start) & (series.index < end)])
+            done += 1
+            if progress is not None:
+                progress(done, len(requested))
+
+        if not columns:
+            return pd.DataFrame()
+        close_data = pd.concat(columns, axis=1).sort_index()
+        return close_data[[s for s in requested if s in close_data.columns]]
+
+
+class SyntheticProvider(MarketDataProvider):
+    """Generated close prices for load-testing without any data source"""
+    name = 'synthetic'
+
+    def __init__(self, model=None, seed=0):
+        self.model = model or os.environ.get('THOMPSON_SYNTHETIC_MODEL', 'factor')
+        self.seed = seed
+
+    def get_close(self, symbols, start_date, end_date, progress=None):
+        num_days = len(pd.bdate_range(start_date, pd.Timestamp(end_date) - pd.Timedelta(days=1)))
+        # Different symbol sets get different (but reproducible) markets
+        seed = [self.seed, zlib.crc32('|'.join(symbols).encode('utf-8'))]
+        close_data, _ = generate_market(len(symbols), num_days, self.model, seed=seed,
+                                        start_date=start_date, symbols=symbols)
+        if progress is not None:
+            progress(len(symbols), len(symbols))
+        return close_data
+
+
+class PriceCache(MarketDataProvider):
+    """On-disk close price store with one .npz file per symbol
+
+    Wraps another provider. Each file keeps the symbol's dates and closes plus
+    the [start, end) range already fetched, so a request only downloads the
+    missing head or tail segments and serves everything else from disk.
+    """
+    name = 'cache'
+
+    def __init__(self, cache_dir=None, provider=None):
+        self.cache_dir = cache_dir or os.environ.get('THOMPSON_PRICE_CACHE', DEFAULT_CACHE_DIR)
+        self.provider = provider if provider is not None else YahooFinanceProvider()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, symbol):
+        return os.path.join(self.cache_dir, symbol.replace(os.sep, '_') + '.npz')
+
+    def _load(self, symbol):
+        path = self._path(symbol)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as stored:
+            series = pd.Series(stored['close'], index=pd.DatetimeIndex(stored['dates']), name=symbol)
+            start, end = pd.DatetimeIndex(stored['coverage'])
+        return series, start, end
+
+    def _save(self, symbol, series, start, end):
+        path = self._path(symbol)
+        # A unique temp file per writer, so concurrent sessions saving the same
+        # symbol never share one
+        fd, tmp_path = tempfile.mkstemp(suffix='.npz', dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(
+                    f,
+                    dates=series.index.values.astype('datetime64[ns]'),
+                    close=series.to_numpy(dtype=np.float64),
+                    coverage=np.array([start, end], dtype='datetime64[ns]')
+                )
+            # Atomic swap so concurrent readers never see a partial file
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get_close(self, symbols, start_date, end_date, progress=None):
+        """Close prices for symbols over [start_date, end_date), fetching only what is missing"""
+        start = pd.Timestamp(start_date).normalize()
+        end = pd.Timestamp(end_date).normalize()
+        # Today's bar may still change, so coverage never extends past it
+        covered_end = min(end, pd.Timestamp.today().normalize())
+
+        stored = {}
+        segments = {}
+        # (segment, symbol) pairs that count as covered once this call is done
+        covered = set()
+        for symbol in symbols:
+            entry = self._load(symbol)
+            if entry is None:
+                entry = (pd.Series(dtype=np.float64, index=pd.DatetimeIndex([]), name=symbol), None, None)
+                missing = [(start, end)]
+            else:
+                _, cached_start, cached_end = entry
+                missing = []
+                if start < cached_start:
+                    missing.append((start, cached_start))
+                if end > cached_end:
+                    missing.append((cached_end, end))
+            stored[symbol] = entry
+            for segment in missing:
+                # Segments without a single weekday have nothing to download
+                if len(pd.bdate_range(segment[0], segment[1] - pd.Timedelta(days=1))):
+                    segments.setdefault(segment, []).append(symbol)
+                else:
+                    covered.add((segment, symbol))
+
+        # Symbols served entirely from disk count as done straight away
+        pending = {symbol: 0 for symbol in symbols}
+        for seg_symbols in segments.values():
+            for symbol in seg_symbols:
+                pending[symbol] += 1
+        done = sum(1 for count in pending.values() if count == 0)
+        if progress is not None:
+            progress(done, len(pending))
+
+        # One download per distinct segment, shared by all symbols missing it
+        fetched = {symbol: [] for symbol in symbols}
+        for (seg_start, seg_end), seg_symbols in segments.items():
+            close_data = self.provider.get_close(
+                seg_symbols, seg_start.strftime('%Y-%m-%d'), seg_end.strftime('%Y-%m-%d')
+            )
+            for symbol in seg_symbols:
+                rows = close_data[symbol].dropna() if symbol in close_data else None
+                # An empty or all-NaN column is how failed downloads (rate limits,
+                # network errors) come back, so the segment stays uncovered and is
+                # requested again next time
+                if rows is not None and len(rows):
+                    fetched[symbol].append(rows)
+                    covered.add(((seg_start, seg_end), symbol))
+                pending[symbol] -= 1
+                done += pending[symbol] == 0
+            if progress is not None:
+                progress(done, len(pending))
+
+        columns = []
+        for symbol in symbols:
+            series, cached_start, cached_end = stored[symbol]
+            # Coverage only grows over the segments that actually came back
+            if cached_start is None:
+                new_start, new_end = (start, covered_end) if ((start, end), symbol) in covered else (None, None)
+            else:
+                new_start = start if ((start, cached_start), symbol) in covered else cached_start
+                new_end = max(covered_end, cached_end) if ((cached_end, end), symbol) in covered else cached_end
+            if new_start is not None and (fetched[symbol] or (new_start, new_end) != (cached_start, cached_end)):
+                series = pd.concat([series] + fetched[symbol])
+                series = series[~series.index.duplicated(keep='last')].sort_index()
+                series.index = pd.DatetimeIndex(series.index).tz_localize(None)
+                self._save(symbol, series, new_start, new_end)
+            columns.append(series[(series.index >= start) & (series.index < end)].rename(symbol))
+
+        if not columns:
+            return pd.DataFrame()
+        return pd.concat(columns, axis=1).sort_index()
+
+
+PROVIDERS = {
+    YahooFinanceProvider.name: YahooFinanceProvider,
+    DirectoryProvider.name: DirectoryProvider,
+    SyntheticProvider.name: SyntheticProvider,
+}
+
+
+def get_provider(name=None, **kwargs):
+    """Build a provider by name, defaulting to the THOMPSON_DATA_PROVIDER environment variable"""
+    name = name or os.environ.get('THOMPSON_DATA_PROVIDER', DEFAULT_PROVIDER)
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown data provider '{name}', expected one of {sorted(PROVIDERS)}")
+    return PROVIDERS[name](**kwargs)
@@ -0,0 +1,243 @@
+"""Bandit policies for the vectorized simulation engine
+
+A policy works on batched state: every array in its state dict has shape
+(C, N, K) for C configurations, N simulations and K symbols. Each day the
+engine asks the policy for (C, N, K) scores, holds the top-k symbols of
+every row and hands back the flat (C*N, k) picks with their returns.
+Policies only ever see standard-normal noise drawn by the engine, so all
+policies in one run share the same random numbers. The noise is (N, W) when
+every configuration shares it and (C, N, W) when each draws its own, so
+policies slice it along the last axis only.
+
+Policies:
+    thompson          Gaussian Thompson Sampling with a conjugate normal posterior
+    ucb1              posterior mean plus a UCB1 exploration bonus
+    epsilon_greedy    posterior mean, or a uniformly random symbol with probability epsilon
+    discounted        Thompson Sampling that geometrically forgets old observations
+    sliding_window    Thompson Sampling on the last `window` observations only
+"""
+from statistics import NormalDist
+
+import numpy as np
+
+# Smallest prior variance used. A symbol with flat prices has zero return
+# variance, which would make its prior mean 0/0 = NaN and, since NaN ranks
+# above every number, get it selected every day
+MIN_PRIOR_VAR = 1e-12
+
+
+def _flat(array):
+    """(C*N, K) view of a (C, N, K) state array for per-row fancy indexing"""
+    return array.reshape(-1, array.shape[-1])
+
+
+def _rows(selected):
+    return np.arange(len(selected))[:, None]
+
+
+class Policy:
+    """Batched bandit policy run by the simulation engine"""
+    name = None
+
+    def noise_width(self, num_symbols):
+        """Standard-normal draws the policy needs per simulation and day
+
+        The first num_symbols come from the simulation's own stream, the same
+        draws Thompson Sampling uses; any beyond them come from a separate
+        child stream, so adding a policy never shifts another policy's noise.
+        """
+        return num_symbols
+
+    def init_state(self, prior_means, prior_vars, obs_var):
+        """State dict from (C, N, K) prior means and variances and (C, N, 1) observation variances"""
+        raise NotImplementedError
+
+    def scores(self, state, noise, t):
+        """(C, N, K) scores for day t; noise is the day's (N, noise_width) or (C, N, noise_width) draw"""
+        raise NotImplementedError
+
+    def update(self, state, selected, rewards, t):
+        """Learn from the (C*N, k) held symbol indices and their returns on day t"""
+        raise NotImplementedError
+
+
+def floor_prior_vars(prior_vars):
+    """Prior variances raised to MIN_PRIOR_VAR, with NaN (no variance estimate) mapped to it too"""
+    return np.fmax(prior_vars, MIN_PRIOR_VAR)
+
+
+def posterior_from_stats(prior_precision, prior_weighted, counts, sums, obs_var):
+    """Normal posterior (means, precisions) from per-symbol observation counts and reward sums
+
+    ``prior_precision`` is 1 / prior variance and ``prior_weighted`` is prior
+    mean / prior variance. With a fixed observation variance the posterior
+    depends on the observations only through their count and sum.
+    """
+    precision = prior_precision + counts / obs_var
+    means = (prior_weighted + sums / obs_var) / precision
+    return means, precision
+
+
+class SufficientStatsPolicy(Policy):
+    """Normal-normal posterior over each symbol's mean return kept as (count, sum) per symbol
+
+    An update is a single add into the counts and sums. The posterior means
+    and standard deviations derived from them are cached and refreshed only
+    for the symbols whose statistics changed.
+    """
+
+    def init_state(self, prior_means, prior_vars, obs_var):
+        prior_vars = floor_prior_vars(prior_vars)
+        state = {
+            'prior_precision': 1 / prior_vars,
+            'prior_weighted': prior_means / prior_vars,
+            'obs_var': obs_var,
+            'counts': np.zeros(prior_means.shape),
+            'sums': np.zeros(prior_means.shape)
+        }
+        means, precision = posterior_from_stats(state['prior_precision'], state['prior_weighted'],
+                                                state['counts'], state['sums'], obs_var)
+        state['means'] = means
+        state['stds'] = 1 / np.sqrt(precision)
+        return state
+
+    def refresh(self, state, rows, selected):
+        """Recompute the cached posterior for the (rows, selected) cells"""
+        means, precision = posterior_from_stats(
+            _flat(state['prior_precision'])[rows, selected], _flat(state['prior_weighted'])[rows, selected],
+            _flat(state['counts'])[rows, selected], _flat(state['sums'])[rows, selected],
+            _flat(state['obs_var'])
+        )
+        _flat(state['means'])[rows, selected] = means
+        _flat(state['stds'])[rows, selected] = 1 / np.sqrt(precision)
+
+    def update(self, state, selected, rewards, t):
+        rows = _rows(selected)
+        _flat(state['counts'])[rows, selected] += 1
+        _flat(state['sums'])[rows, selected] += rewards
+        self.refresh(state, rows, selected)
+
+
+class GaussianThompson(SufficientStatsPolicy):
+    """Hold the symbols with the highest draw from their posterior"""
+    name = 'thompson'
+
+    def scores(self, state, noise, t):
+        num_symbols = state['means'].shape[-1]
+        return state['means'] + state['stds'] * noise[..., :num_symbols]
+
+
+class UCB1(SufficientStatsPolicy):
+    """Posterior mean plus an exploration bonus that shrinks with each symbol's pulls
+
+    The bonus is ``c * sigma * sqrt(2 ln(t + 1) / (n + 1))`` where sigma is the
+    symbol's prior standard deviation, which puts it on the scale of daily
+    returns, and the prior counts as one pull.
+    """
+    name = 'ucb1'
+
+    def __init__(self, c=1.0):
+        self.c = c
+
+    def init_state(self, prior_means, prior_vars, obs_var):
+        state = super().init_state(prior_means, prior_vars, obs_var)
+        state['scale'] = self.c * np.sqrt(prior_vars)
+        return state
+
+    def scores(self, state, noise, t):
+        return state['means'] + state['scale'] * np.sqrt(2 * np.log(t + 1) / (state['counts'] + 1))
+
+
+class EpsilonGreedy(SufficientStatsPolicy):
+    """Hold the best posterior means, or a random set of symbols with probability epsilon
+
+    One extra normal draw per day decides exploration (it falls below the
+    epsilon quantile with probability epsilon); the ranking of the i.i.d.
+    per-symbol draws then gives a uniformly random pick.
+    """
+    name = 'epsilon_greedy'
+
+    def __init__(self, epsilon=0.1):
+        self.epsilon = epsilon
+        if epsilon <= 0:
+            self.threshold = -np.inf
+        elif epsilon >= 1:
+            self.threshold = np.inf
+        else:
+            self.threshold = NormalDist().inv_cdf(epsilon)
+
+    def noise_width(self, num_symbols):
+        return num_symbols + 1
+
+    def scores(self, state, noise, t):
+        num_symbols = state['means'].shape[-1]
+        explore = noise[..., num_symbols:num_symbols + 1] < self.threshold
+        return np.where(explore, noise[..., :num_symbols], state['means'])
+
+
+class DiscountedThompson(GaussianThompson):
+    """Thompson Sampling whose counts and sums decay by gamma every day"""
+    name = 'discounted'
+
+    def __init__(self, gamma=0.99):
+        self.gamma = gamma
+
+    def update(self, state, selected, rewards, t):
+        # Decay touches every symbol, so the whole posterior is recomputed
+        state['counts'] *= self.gamma
+        state['sums'] *= self.gamma
+        rows = _rows(selected)
+        _flat(state['counts'])[rows, selected] += 1
+        _flat(state['sums'])[rows, selected] += rewards
+        means, precision = posterior_from_stats(state['prior_precision'], state['prior_weighted'],
+                                                state['counts'], state['sums'], state['obs_var'])
+        state['means'][...] = means
+        state['stds'][...] = 1 / np.sqrt(precision)
+
+
+class SlidingWindowThompson(GaussianThompson):
+    """Thompson Sampling on each symbol's observations from the last `window` days"""
+    name = 'sliding_window'
+
+    def __init__(self, window=63):
+        self.window = window
+
+    def update(self, state, selected, rewards, t):
+        counts = _flat(state['counts'])
+        sums = _flat(state['sums'])
+        rows = _rows(selected)
+        if 'history' not in state:
+            state['history'] = np.empty((self.window,) + selected.shape, dtype=selected.dtype)
+            state['history_rewards'] = np.empty((self.window,) + rewards.shape)
+
+        # Drop the observations that fall out of the window, then add today's
+        slot = t % self.window
+        if t >= self.window:
+            expired = state['history'][slot]
+            counts[rows, expired] -= 1
+            sums[rows, expired] -= state['history_rewards'][slot]
+            self.refresh(state, rows, expired)
+        counts[rows, selected] += 1
+        sums[rows, selected] += rewards
+        self.refresh(state, rows, selected)
+        state['history'][slot] = selected
+        state['history_rewards'][slot] = rewards
+
+
+POLICIES = {
+    GaussianThompson.name: GaussianThompson,
+    UCB1.name: UCB1,
+    EpsilonGreedy.name: EpsilonGreedy,
+    DiscountedThompson.name: DiscountedThompson,
+    SlidingWindowThompson.name: SlidingWindowThompson,
+}
+
+
+def get_policy(policy=None, **kwargs):
+    """Build a policy by registry name; Policy instances pass through unchanged"""
+    if isinstance(policy, Policy):
+        return policy
+    name = policy or GaussianThompson.name
+    if name not in POLICIES:
+        raise ValueError(f"Unknown policy '{name}', expected one of {sorted(POLICIES)}")
+    return POLICIES[name](**kwargs)
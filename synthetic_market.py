@@ -0,0 +1,124 @@
+"""Synthetic close prices for offline scale testing
+
+generate_market returns ``(close_data, stats)`` in exactly the shape
+download_and_prepare_data does, so the trader, the simulation runner and the
+dashboard can be load-tested on universes and histories far larger than a
+live download allows. Prices are generated in day chunks and every random
+component draws from its own SeedSequence child, so the output for a seed
+does not depend on the chunk size.
+
+Models:
+    gbm     independent geometric Brownian motion per symbol
+    factor  correlated returns from a few common factors plus idiosyncratic noise
+    regime  GBM whose drift and volatility switch with a Markov chain of market regimes
+"""
+import numpy as np
+import pandas as pd
+
+MODELS = ('gbm', 'factor', 'regime')
+TRADING_DAYS = 252
+
+# (annual drift, volatility multiplier) per regime and the daily transition matrix
+DEFAULT_REGIMES = ((0.20, 0.8), (-0.25, 1.8))
+DEFAULT_TRANSITIONS = ((0.99, 0.01), (0.03, 0.97))
+
+
+def _symbol_names(num_symbols):
+    width = max(len(str(num_symbols - 1)), 5)
+    return [f'SYN{i:0{width}d}' for i in range(num_symbols)]
+
+
+def _regime_path(num_days, rng, transitions):
+    """Markov chain of regime indices, one per day"""
+    transitions = np.asarray(transitions, dtype=np.float64)
+    cumulative = np.cumsum(transitions, axis=1)
+    uniforms = rng.random(num_days)
+    path = np.empty(num_days, dtype=np.intp)
+    state = 0
+    for t in range(num_days):
+        state = min(int(np.searchsorted(cumulative[state], uniforms[t], side='right')), len(transitions) - 1)
+        path[t] = state
+    return path
+
+
+def iter_market_chunks(num_symbols, num_days, model='gbm', seed=None, chunk_days=256,
+                       num_factors=3, regimes=DEFAULT_REGIMES, transitions=DEFAULT_TRANSITIONS):
+    """Yield (start_row, log_returns) chunks of shape (chunk, num_symbols) for days 1..num_days-1"""
+    if model not in MODELS:
+        raise ValueError(f"Unknown synthetic model '{model}', expected one of {MODELS}")
+
+    param_seq, noise_seq, factor_seq, regime_seq = np.random.SeedSequence(seed).spawn(4)
+    params = np.random.default_rng(param_seq)
+    noise_rng = np.random.default_rng(noise_seq)
+    factor_rng = np.random.default_rng(factor_seq)
+
+    dt = 1 / TRADING_DAYS
+    drift = params.uniform(-0.05, 0.25, num_symbols)
+    vol = params.uniform(0.15, 0.60, num_symbols)
+
+    if model == 'factor':
+        factor_vol = params.uniform(0.10, 0.25, num_factors)
+        betas = params.normal(0.0, 0.5, (num_factors, num_symbols))
+        betas[0] = params.uniform(0.5, 1.5, num_symbols)  # the first factor acts as the market
+        # Idiosyncratic vol keeps each symbol's total vol close to its GBM draw
+        systematic_var = (betas ** 2 * factor_vol[:, None] ** 2).sum(axis=0)
+        idio_vol = np.sqrt(np.maximum(vol ** 2 - systematic_var, (0.1 * vol) ** 2))
+        total_var = systematic_var + idio_vol ** 2
+    elif model == 'regime':
+        regime_drift = np.array([r[0] for r in regimes])
+        regime_scale = np.array([r[1] for r in regimes])
+        regime_path = _regime_path(max(num_days - 1, 0), np.random.default_rng(regime_seq), transitions)
+
+    for start in range(0, max(num_days - 1, 0), chunk_days):
+        rows = min(chunk_days, num_days - 1 - start)
+        z = noise_rng.standard_normal((rows, num_symbols))
+        if model == 'gbm':
+            log_returns = (drift - 0.5 * vol ** 2) * dt + vol * np.sqrt(dt) * z
+        elif model == 'factor':
+            factors = factor_rng.standard_normal((rows, num_factors)) * factor_vol * np.sqrt(dt)
+            log_returns = (drift - 0.5 * total_var) * dt + factors @ betas + idio_vol * np.sqrt(dt) * z
+        else:
+            chunk_regimes = regime_path[start:start + rows]
+            scale = regime_scale[chunk_regimes][:, None]
+            chunk_drift = (drift + regime_drift[chunk_regimes][:, None]) - 0.5 * (vol * scale) ** 2
+            log_returns = chunk_drift * dt + vol * scale * np.sqrt(dt) * z
+        yield start + 1, log_returns
+
+
+def generate_market(num_symbols, num_days, model='gbm', seed=None, start_date='2000-01-03',
+                    symbols=None, chunk_days=256, dtype=np.float64, initial_price=100.0, **model_params):
+    """Synthetic (close_data, stats) shaped like download_and_prepare_data output
+
+    ``num_days`` is the number of close rows on a business-day index starting at
+    ``start_date``. ``dtype=np.float32`` halves memory for very large universes.
+    """
+    symbols = list(symbols) if symbols is not None else _symbol_names(num_symbols)
+    num_symbols = len(symbols)
+
+    close = np.empty((num_days, num_symbols), dtype=dtype)
+    log_price = np.full(num_symbols, np.log(initial_price))
+    if num_days:
+        close[0] = initial_price
+
+    # Running sums of simple returns give the stats without keeping the returns
+    count = 0
+    total = np.zeros(num_symbols)
+    total_sq = np.zeros(num_symbols)
+    for row, log_returns in iter_market_chunks(num_symbols, num_days, model, seed, chunk_days, **model_params):
+        prices = log_price + np.cumsum(log_returns, axis=0)
+        close[row:row + len(log_returns)] = np.exp(prices)
+        log_price = prices[-1]
+
+        simple_returns = np.expm1(log_returns)
+        count += len(simple_returns)
+        total += simple_returns.sum(axis=0)
+        total_sq += np.square(simple_returns).sum(axis=0)
+
+    index = pd.bdate_range(start_date, periods=num_days)
+    close_data = pd.DataFrame(close, index=index, columns=symbols, copy=False)
+
+    mean = total / count if count else np.full(num_symbols, np.nan)
+    std = np.sqrt(np.maximum(total_sq - count * mean ** 2, 0) / (count - 1)) if count > 1 else np.full(num_symbols, np.nan)
+    stats = pd.DataFrame({'mean': mean, 'std': std}, index=symbols)
+    stats['sharpe'] = stats['mean'] / stats['std']
+    return close_data, stats
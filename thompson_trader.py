@@ -1,118 +1,1020 @@
+import argparse
+import copy
+import hashlib
+import inspect
+import itertools
+import json
+import struct
+import sys
+import threading
+from collections import OrderedDict
+
 import numpy as np
 import pandas as pd
-import yfinance as yf
+
+from instrumentation import PerformanceReport, enable_timing_log, span
+from market_data import PROVIDERS, DirectoryProvider, PriceCache, YahooFinanceProvider, get_provider
+from policies import POLICIES, GaussianThompson, Policy, floor_prior_vars, get_policy, posterior_from_stats
+
+# Simulations run in blocks of this size; every simulation draws from its own
+# SeedSequence child, so results do not depend on how blocks are scheduled
+SIMULATION_BLOCK_SIZE = 64
+# Upper bound on pre-drawn noise held at once by the batch engine (float64 elements)
+NOISE_CHUNK_ELEMENTS = 2 ** 21
+# Default Thompson Sampling hyperparameters: prior variance is the historical
+# return variance scaled by PRIOR_INFLATION, and OBS_VAR is the assumed noise
+# variance of one daily return observation
+PRIOR_INFLATION = 1.5
+OBS_VAR = 0.0001
+# Default number of points per series sent to a time-series chart
+CHART_MAX_POINTS = 1000
+
+
+# Checkpoint layout for ThompsonSamplingStockTrader.state(): header, UTF-8 symbol
+# table, then float64 prior means, prior variances, observation counts, reward
+# sums and last closes, int32 indices of the held stocks, then the PCG64 stream
+# position when present
+_STATE_MAGIC = b'TSTS'
+_STATE_VERSION = 4
+_STATE_HEADER = struct.Struct('<4sBBIIIdddI')
+_RNG_STATE = struct.Struct('<16s16sBI')
+_HAS_RNG = 1
+_HAS_CLOSE = 2
+
+
+def selection_code_dtype(num_symbols):
+    """Smallest integer dtype for selection codes over num_symbols symbols"""
+    return np.int16 if num_symbols <= np.iinfo(np.int16).max else np.int32
+
+
+def top_k_indices(samples, k):
+    """Column indices of the k largest samples along the last axis, shape (..., k), in no particular order"""
+    num_arms = samples.shape[-1]
+    if k == 1:
+        return samples.argmax(axis=-1)[..., None]
+    if k >= num_arms:
+        return np.broadcast_to(np.arange(num_arms), samples.shape[:-1] + (num_arms,))
+    # One O(K) partial sort instead of a full argsort per row
+    return np.argpartition(samples, num_arms - k, axis=-1)[..., num_arms - k:]
+
+
+def _check_top_k(top_k):
+    """Reject top_k values that cannot hold any stock"""
+    if top_k < 1:
+        raise ValueError("top_k must be >= 1")
+    return top_k
+
+
+def simulation_rngs(seed, num_simulations):
+    """One independent Generator per simulation, spawned from a single SeedSequence"""
+    return [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(num_simulations)]
+
 
 class ThompsonSamplingStockTrader:
-    def __init__(self, symbols, stock_data, stats, initial_investment=100000):
-        self.symbols = symbols
+    # Posteriors, rewards and selections live in NumPy arrays indexed by the
+    # symbol's column position; the list attributes are built on access.
+    # The posterior is kept as the prior plus per-symbol observation counts
+    # and reward sums, so an update is one add and states from different
+    # shards merge by adding counts and sums
+    __slots__ = (
+        'symbols', 'stock_data', 'stats', 'initial_investment', 'symbol_index',
+        'returns_data', 'returns', 'prior_means', 'prior_vars', 'counts', 'sums',
+        'selection_indices', 'rewards', 'values', 'investment_value', 'step', 'rng', 'noise',
+        'last_close', 'current', 'prior_inflation', 'obs_var', 'top_k', 'priors_initialized'
+    )
+
+    def __init__(self, symbols, stock_data, stats, initial_investment=100000, rng=None,
+                 prior_inflation=PRIOR_INFLATION, obs_var=OBS_VAR, top_k=1):
+        # With top_k > 1 capital is split equally across the k highest samples each day
+        _check_top_k(top_k)
+        self.symbols = list(symbols)
+        self.symbol_index = {symbol: i for i, symbol in enumerate(self.symbols)}
         self.stock_data = stock_data
         self.stats = stats
         self.initial_investment = initial_investment
+        self.prior_inflation = prior_inflation
+        self.obs_var = obs_var
+        self.top_k = top_k
+        self.returns_data = None
+        self.returns = None
+        self.rng = rng if rng is not None else np.random.default_rng()
         self.reset()
 
     def reset(self):
-        self.posterior_means = {}
-        self.posterior_vars = {}
-        self.daily_selections = []
-        self.daily_rewards = []
-        self.portfolio_values = [self.initial_investment]
+        num_symbols = len(self.symbols)
+        self.prior_means = np.zeros(num_symbols)
+        self.prior_vars = np.ones(num_symbols)
+        self.counts = np.zeros(num_symbols)
+        self.sums = np.zeros(num_symbols)
+        self.selection_indices = np.empty(self._history_shape(0), dtype=np.intp)
+        self.rewards = np.empty(self._history_shape(0))
+        self.values = np.array([self.initial_investment], dtype=np.float64)
         self.investment_value = self.initial_investment
+        self.step = 0
+        self.noise = None
+        self.last_close = None
+        self.current = None
+        self.priors_initialized = False
+
+    @property
+    def daily_selections(self):
+        indices = self.selection_indices[:self.step]
+        return np.asarray(self.symbols, dtype=object)[indices].tolist()
+
+    @property
+    def daily_rewards(self):
+        # rewards holds each held stock's return; the portfolio earned their mean
+        rewards = self.rewards[:self.step]
+        return (rewards if self.top_k == 1 else rewards.mean(axis=1)).tolist()
+
+    @property
+    def posterior_means(self):
+        return self.posterior()[0]
+
+    @property
+    def posterior_vars(self):
+        return self.posterior()[1]
+
+    def posterior(self, counts=None, sums=None):
+        """(means, variances) of the posterior for the given counts and sums, or the current ones"""
+        counts = self.counts if counts is None else counts
+        sums = self.sums if sums is None else sums
+        means, precision = posterior_from_stats(1 / self.prior_vars, self.prior_means / self.prior_vars,
+                                                counts, sums, self.obs_var)
+        return means, 1 / precision
+
+    def posterior_at(self, step):
+        """Exact posterior (means, variances) after the first `step` days, rebuilt from the history"""
+        indices = self.selection_indices[:step].ravel()
+        num_symbols = len(self.symbols)
+        counts = np.bincount(indices, minlength=num_symbols).astype(np.float64)
+        sums = np.bincount(indices, weights=self.rewards[:step].ravel(), minlength=num_symbols)
+        return self.posterior(counts, sums)
+
+    def merge(self, other):
+        """Add the observations of another trader over the same symbols and prior into this one"""
+        if other.symbols != self.symbols:
+            raise ValueError("Can only merge traders over the same symbols")
+        self.counts = self.counts + other.counts
+        self.sums = self.sums + other.sums
+        return self
+
+    @property
+    def portfolio_values(self):
+        return self.values[:self.step + 1].tolist()
 
     def calculate_returns(self):
         self.returns_data = self.stock_data.pct_change().dropna()
+        # Convert once so the daily loop reads rewards by integer position
+        self.returns = np.ascontiguousarray(
+            self.returns_data[self.symbols].to_numpy(dtype=np.float64)
+        )
         return self.returns_data
 
     def initialize_priors(self):
-        for symbol in self.symbols:
-            mu = self.stats.loc[symbol, 'mean']
-            var = self.stats.loc[symbol, 'std'] ** 2
-            self.posterior_means[symbol] = mu
-            self.posterior_vars[symbol] = var * 1.5
+        self.prior_means = self.stats.loc[self.symbols, 'mean'].to_numpy(dtype=np.float64).copy()
+        self.prior_vars = floor_prior_vars(
+            self.stats.loc[self.symbols, 'std'].to_numpy(dtype=np.float64) ** 2 * self.prior_inflation
+        )
+        self.counts = np.zeros(len(self.symbols))
+        self.sums = np.zeros(len(self.symbols))
+        self.priors_initialized = True
+
+    def select_index(self):
+        if self.noise is not None and self.step < len(self.noise):
+            z = self.noise[self.step]
+        else:
+            z = self.rng.standard_normal(len(self.symbols))
+        means, precision = posterior_from_stats(1 / self.prior_vars, self.prior_means / self.prior_vars,
+                                                self.counts, self.sums, self.obs_var)
+        samples = means + 1 / np.sqrt(precision) * z
+        # NaN would rank above every sample, so it can never be picked instead
+        samples = np.where(np.isnan(samples), -np.inf, samples)
+        if self.top_k == 1:
+            return int(samples.argmax())
+        return top_k_indices(samples, self.top_k)
 
     def select_stock(self):
-        samples = {
-            symbol: np.random.normal(self.posterior_means[symbol], np.sqrt(self.posterior_vars[symbol]))
-            for symbol in self.symbols
-        }
-        return max(samples, key=samples.get)
+        index = self.select_index()
+        if self.top_k == 1:
+            return self.symbols[index]
+        return [self.symbols[i] for i in index]
+
+    def update_index(self, index, reward):
+        self.counts[index] += 1
+        self.sums[index] += reward
 
     def update_posterior(self, symbol, reward):
-        prior_mean = self.posterior_means[symbol]
-        prior_var = self.posterior_vars[symbol]
-        obs_var = 0.0001
-        new_var = 1 / (1 / prior_var + 1 / obs_var)
-        new_mean = new_var * (prior_mean / prior_var + reward / obs_var)
-        self.posterior_means[symbol] = new_mean
-        self.posterior_vars[symbol] = new_var
+        self.update_index(self.symbol_index[symbol], reward)
+
+    def _choose(self):
+        # select_stock and update_posterior are the symbol-level hooks subclasses
+        # may override; when they are, the index fast path would bypass them
+        if type(self).select_stock is ThompsonSamplingStockTrader.select_stock:
+            return self.select_index()
+        choice = self.select_stock()
+        if self.top_k == 1:
+            return self.symbol_index[choice]
+        return np.array([self.symbol_index[symbol] for symbol in choice], dtype=np.intp)
+
+    def _learn(self, index, arm_rewards):
+        if type(self).update_posterior is ThompsonSamplingStockTrader.update_posterior:
+            self.update_index(index, arm_rewards)
+        elif self.top_k == 1:
+            self.update_posterior(self.symbols[index], float(arm_rewards))
+        else:
+            for i, reward in zip(index, arm_rewards):
+                self.update_posterior(self.symbols[i], float(reward))
 
     def run(self):
         self.calculate_returns()
         self.initialize_priors()
-        for date in self.returns_data.index:
-            selected = self.select_stock()
-            reward = self.returns_data.loc[date, selected]
-            self.update_posterior(selected, reward)
+        num_days = len(self.returns)
+        # All standard-normal noise for the run in one (T, K) draw, scaled by the
+        # posterior standard deviation at each step
+        self.noise = self.rng.standard_normal((num_days, len(self.symbols)))
+        self.selection_indices = np.empty(self._history_shape(num_days), dtype=np.intp)
+        self.rewards = np.empty(self._history_shape(num_days))
+        self.values = np.empty(num_days + 1)
+        self.values[0] = self.investment_value
+        for t in range(num_days):
+            selected = self._choose()
+            # Each held stock's posterior learns from its own return; the
+            # portfolio earns their equal-weighted mean
+            arm_rewards = self.returns[t, selected]
+            self._learn(selected, arm_rewards)
+            reward = arm_rewards if self.top_k == 1 else arm_rewards.mean()
             self.investment_value *= (1 + reward)
-            self.portfolio_values.append(self.investment_value)
-            self.daily_selections.append(selected)
-            self.daily_rewards.append(reward)
+            self.values[t + 1] = self.investment_value
+            self.selection_indices[t] = selected
+            self.rewards[t] = arm_rewards
+            self.step = t + 1
         return self.portfolio_values
 
+    def _history_shape(self, num_days):
+        # Top-k runs record k held indices per day
+        if self.top_k == 1:
+            return (num_days,)
+        return (num_days, min(self.top_k, len(self.symbols)))
+
+    def _record(self, index, arm_rewards):
+        # Grow the history arrays geometrically so streaming appends stay O(1) amortized
+        if self.step >= len(self.selection_indices):
+            extra = max(len(self.selection_indices), 256)
+            self.selection_indices = np.concatenate([self.selection_indices[:self.step],
+                                                     np.empty(self._history_shape(extra), dtype=np.intp)])
+            self.rewards = np.concatenate([self.rewards[:self.step], np.empty(self._history_shape(extra))])
+            self.values = np.concatenate([self.values[:self.step + 1], np.empty(extra)])
+        self.selection_indices[self.step] = index
+        self.rewards[self.step] = arm_rewards
+        self.values[self.step + 1] = self.investment_value
+        self.step += 1
+
+    def observe(self, bar):
+        """Feed one bar of close prices and return the symbol to hold until the next bar
+
+        ``bar`` is a mapping (dict or Series) keyed by symbol or an array in
+        symbol order. The first bar only records prices; each later bar pays
+        out the held stock's return and updates its posterior in O(K). With
+        top_k > 1 the list of held symbols is returned instead.
+        """
+        if isinstance(bar, (dict, pd.Series)):
+            closes = np.array([bar.get(symbol, np.nan) for symbol in self.symbols], dtype=np.float64)
+        else:
+            closes = np.array(bar, dtype=np.float64)
+
+        if self.last_close is None:
+            if not self.priors_initialized:
+                self.initialize_priors()
+        else:
+            # Symbols missing from this bar carry their last close forward
+            closes = np.where(np.isfinite(closes), closes, self.last_close)
+            arm_rewards = closes[self.current] / self.last_close[self.current] - 1
+            arm_rewards = np.where(np.isfinite(arm_rewards), arm_rewards, 0.0)
+            self._learn(self.current, arm_rewards)
+            reward = float(arm_rewards.mean())
+            self.investment_value *= (1 + reward)
+            self._record(self.current, arm_rewards)
+
+        self.last_close = closes
+        self.current = self._choose()
+        if self.top_k == 1:
+            return self.symbols[self.current]
+        return [self.symbols[i] for i in self.current]
+
+    def state(self):
+        """Serialize the prior, sufficient statistics, held position and RNG stream to a compact binary checkpoint"""
+        flags = 0
+        rng_blob = b''
+        rng_state = self.rng.bit_generator.state
+        if rng_state['bit_generator'] == 'PCG64':
+            flags |= _HAS_RNG
+            rng_blob = _RNG_STATE.pack(
+                rng_state['state']['state'].to_bytes(16, 'little'),
+                rng_state['state']['inc'].to_bytes(16, 'little'),
+                rng_state['has_uint32'], rng_state['uinteger']
+            )
+        last_close = self.last_close
+        if last_close is not None:
+            flags |= _HAS_CLOSE
+        else:
+            last_close = np.full(len(self.symbols), np.nan)
+
+        held = np.empty(0, dtype='<i4') if self.current is None else np.atleast_1d(self.current).astype('<i4')
+
+        symbols = '\n'.join(self.symbols).encode('utf-8')
+        header = _STATE_HEADER.pack(
+            _STATE_MAGIC, _STATE_VERSION, flags, len(self.symbols), self.top_k, len(held),
+            self.initial_investment, self.investment_value, self.obs_var, len(symbols)
+        )
+        arrays = np.concatenate([self.prior_means, self.prior_vars, self.counts, self.sums, last_close]).astype('<f8')
+        return header + symbols + arrays.tobytes() + held.tobytes() + rng_blob
+
+    @classmethod
+    def from_state(cls, blob, stock_data=None, stats=None):
+        """Rebuild a trader from a state() checkpoint without replaying any history"""
+        (magic, version, flags, num_symbols, top_k, num_held, initial_investment, investment_value,
+         obs_var, symbols_len) = _STATE_HEADER.unpack_from(blob)
+        if magic != _STATE_MAGIC or version != _STATE_VERSION:
+            raise ValueError("Not a ThompsonSamplingStockTrader checkpoint")
+        offset = _STATE_HEADER.size
+        symbols = blob[offset:offset + symbols_len].decode('utf-8').split('\n') if num_symbols else []
+        offset += symbols_len
+        arrays = np.frombuffer(blob, dtype='<f8', count=5 * num_symbols, offset=offset).reshape(5, num_symbols)
+        offset += arrays.nbytes
+        held = np.frombuffer(blob, dtype='<i4', count=num_held, offset=offset).astype(np.intp)
+        offset += 4 * num_held
+
+        rng = None
+        if flags & _HAS_RNG:
+            state, inc, has_uint32, uinteger = _RNG_STATE.unpack_from(blob, offset)
+            rng = np.random.Generator(np.random.PCG64())
+            rng.bit_generator.state = {
+                'bit_generator': 'PCG64',
+                'state': {'state': int.from_bytes(state, 'little'), 'inc': int.from_bytes(inc, 'little')},
+                'has_uint32': has_uint32,
+                'uinteger': uinteger
+            }
+
+        trader = cls(symbols, stock_data, stats, initial_investment, rng=rng, obs_var=obs_var, top_k=top_k)
+        trader.prior_means, trader.prior_vars, trader.counts, trader.sums = arrays[:4].copy()
+        # The checkpoint's prior and statistics are authoritative, even when it was
+        # taken before the first bar, so observe() never re-initializes them
+        trader.priors_initialized = True
+        if flags & _HAS_CLOSE:
+            trader.last_close = arrays[4].copy()
+        if num_held:
+            trader.current = int(held[0]) if top_k == 1 else held
+        trader.investment_value = investment_value
+        trader.values = np.array([investment_value], dtype=np.float64)
+        return trader
+
+
+def download_and_prepare_data(symbols, start_date, end_date, provider=None, progress=None):
+    # Any MarketDataProvider works here: Yahoo Finance by default, a local
+    # directory for offline runs, or a PriceCache wrapping either.
+    # progress(symbols_done, symbols_total) reports symbols as they load
+    if provider is None:
+        provider = YahooFinanceProvider()
+    with span('download_and_prepare_data', symbols=len(symbols), provider=type(provider).__name__):
+        with span('download_and_prepare_data.get_close'):
+            close_data = provider.get_close(symbols, start_date, end_date, progress=progress)
+
+        with span('download_and_prepare_data.clean', days=len(close_data)):
+            close_data = close_data.ffill().dropna(axis=1, how='all')
+            valid_symbols = list(close_data.columns)
+
+        with span('download_and_prepare_data.stats'):
+            returns_data = close_data.pct_change().dropna()
+            stats = returns_data.agg(['mean', 'std'], axis=0).T
+            stats['sharpe'] = stats['mean'] / stats['std']
+        return close_data[valid_symbols], stats.loc[valid_symbols]
+
+
+def _simulate_policy_batch(returns, prior_means, prior_vars, rngs, initial_investment=100000,
+                           obs_vars=(OBS_VAR,), top_k=1, policies=None, active=None):
+    """Run one bandit trader per Generator and configuration over a (T, K) returns array
 
-def download_and_prepare_data(symbols, start_date, end_date):
-    data = yf.download(symbols, start=start_date, end=end_date, progress=False, group_by='ticker')
+    ``prior_vars`` is (C, K) and ``obs_vars`` has length C, one row per
+    configuration, and ``policies`` gives each configuration's Policy
+    (Gaussian Thompson Sampling by default). Every configuration sees the
+    same noise draws (common random numbers), so differences between
+    configurations come from the parameters and policies alone. ``returns``
+    may also be (T, C, K) with (C, K) ``prior_means`` to give each
+    configuration its own market, with a (C, K) boolean ``active`` mask for
+    symbols padded onto the end of each row, as the multi-portfolio runner
+    does. When the rows have different widths K_c, each configuration draws
+    its K_c columns from its own copy of every Generator, which is exactly the
+    noise a standalone run over its K_c symbols gets, so a configuration's
+    results never depend on the others in the batch. Returns (C, N, T+1)
+    portfolio values and (C, N, T) picks, or (C, N, T, k) picks when top_k > 1.
+    """
+    num_days, num_symbols = returns.shape[0], returns.shape[-1]
+    num_simulations = len(rngs)
+    prior_vars = np.atleast_2d(prior_vars)
+    num_configs = len(prior_vars)
+    shape = (num_configs, num_simulations, num_symbols)
+    if policies is None or isinstance(policies, Policy):
+        policies = [policies or GaussianThompson()] * num_configs
 
-    if isinstance(data.columns, pd.MultiIndex):
-        close_data = pd.concat([data[ticker]['Close'].rename(ticker)
-                                for ticker in data.columns.levels[0]
-                                if 'Close' in data[ticker]], axis=1)
+    # Consecutive configurations sharing a policy object are scored and updated as one group
+    groups = []
+    for config, policy in enumerate(policies):
+        if groups and groups[-1][0] is policy:
+            groups[-1][2] = config + 1
+        else:
+            groups.append([policy, config, config + 1])
+    means = np.repeat(np.broadcast_to(prior_means, prior_vars.shape), num_simulations, axis=0).reshape(shape)
+    variances = np.repeat(prior_vars, num_simulations, axis=0).reshape(shape)
+    obs_var = np.repeat(np.asarray(obs_vars, dtype=np.float64), num_simulations).reshape(num_configs, num_simulations, 1)
+    states = [policy.init_state(means[lo:hi], variances[lo:hi], obs_var[lo:hi]) for policy, lo, hi in groups]
+    noise_width = max(policy.noise_width(num_symbols) for policy, _, _ in groups)
+    # Draws beyond the K per-symbol ones (epsilon-greedy's explore variate) come
+    # from a child stream of each simulation's Generator, so the K-wide noise is
+    # the same whichever policies share the run
+    extra_rngs = [rng.spawn(1)[0] for rng in rngs] if noise_width > num_symbols else None
+    width_rngs = None
+    if active is not None:
+        active = np.asarray(active, dtype=bool)
+        widths = active.sum(axis=1)
+        if len(set(widths)) > 1:
+            width_rngs = {width: [copy.deepcopy(rng) for rng in rngs] for width in set(widths)}
+        active = active[:, None, :]
+
+    # Each row's rewards are read from the flattened day of returns at its config's offset
+    daily_returns = returns.reshape(num_days, -1)
+    offsets = 0 if returns.ndim == 2 else np.repeat(np.arange(num_configs) * num_symbols, num_simulations)[:, None]
+    held = min(top_k, num_symbols)
+    pick_shape = (num_days,) if top_k == 1 else (num_days, held)
+    picks = np.empty((num_configs * num_simulations,) + pick_shape, dtype=selection_code_dtype(num_symbols))
+    growth = np.empty((num_configs * num_simulations, num_days + 1))
+    growth[:, 0] = initial_investment
+
+    # Each simulation's noise comes from its own stream in day chunks, which yields
+    # the same values as the single (T, K) draw ThompsonSamplingStockTrader makes.
+    # Rows of different widths get a (C, N, W) draw per day instead of a shared (N, W) one
+    noise_rows = num_simulations * (1 if width_rngs is None else num_configs)
+    chunk_days = max(1, NOISE_CHUNK_ELEMENTS // max(noise_rows * noise_width, 1))
+    for start in range(0, num_days, chunk_days):
+        stop = min(start + chunk_days, num_days)
+        if width_rngs is None:
+            noise = np.stack([rng.standard_normal((stop - start, num_symbols)) for rng in rngs], axis=1)
+        else:
+            drawn = {width: np.stack([rng.standard_normal((stop - start, width)) for rng in streams], axis=1)
+                     for width, streams in width_rngs.items()}
+            noise = np.zeros((stop - start, num_configs, num_simulations, num_symbols))
+            for config, width in enumerate(widths):
+                noise[:, config, :, :width] = drawn[width]
+        if extra_rngs is not None:
+            extra = np.stack([rng.standard_normal((stop - start, noise_width - num_symbols))
+                              for rng in extra_rngs], axis=1)
+            if width_rngs is not None:
+                extra = np.broadcast_to(extra[:, None], noise.shape[:-1] + extra.shape[-1:])
+            noise = np.concatenate([noise, extra], axis=-1)
+
+        for t in range(start, stop):
+            # Row-wise top-k over the (C, N, K) policy scores picks each simulation's stocks
+            day_noise = noise[t - start]
+            if len(groups) == 1:
+                scores = groups[0][0].scores(states[0], day_noise, t)
+            else:
+                scores = np.concatenate([
+                    policy.scores(state, day_noise if width_rngs is None else day_noise[lo:hi], t)
+                    for (policy, lo, hi), state in zip(groups, states)
+                ])
+            # Masked-out symbols and NaN scores (which would otherwise rank first) never get picked
+            if active is not None:
+                scores = np.where(active & ~np.isnan(scores), scores, -np.inf)
+            else:
+                scores = np.where(np.isnan(scores), -np.inf, scores)
+            selected = top_k_indices(scores, top_k).reshape(-1, held)
+            arm_rewards = daily_returns[t, offsets + selected]
+
+            # Every held stock is learned from in one (C*N, k) step per policy
+            for (policy, lo, hi), state in zip(groups, states):
+                rows = slice(lo * num_simulations, hi * num_simulations)
+                policy.update(state, selected[rows], arm_rewards[rows], t)
+
+            # Capital is split equally across the held stocks
+            if top_k == 1:
+                picks[:, t] = selected[:, 0]
+                growth[:, t + 1] = 1 + arm_rewards[:, 0]
+            else:
+                picks[:, t] = selected
+                growth[:, t + 1] = 1 + arm_rewards.mean(axis=1)
+
+    portfolio_values = np.cumprod(growth, axis=1)
+    return (portfolio_values.reshape(num_configs, num_simulations, num_days + 1),
+            picks.reshape((num_configs, num_simulations) + pick_shape))
+
+
+def _simulate_block_shared(shm_name, shape, prior_means, prior_vars, seed_seqs, options):
+    """Process-pool entry point: attach to the shared returns matrix and run one block"""
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        returns = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        rngs = [np.random.default_rng(s) for s in seed_seqs]
+        result = _simulate_policy_batch(returns, prior_means, prior_vars, rngs, **options)
+        del returns
+        return result
+    finally:
+        shm.close()
+
+
+def _simulate_policy_blocks(returns, prior_means, prior_vars, num_simulations, seed,
+                            workers=None, progress=None, **options):
+    """Run the batch engine block by block, optionally across a process pool
+
+    ``options`` are passed through to _simulate_policy_batch.
+    """
+    seed_seqs = np.random.SeedSequence(seed).spawn(num_simulations)
+    blocks = [seed_seqs[start:start + SIMULATION_BLOCK_SIZE]
+              for start in range(0, num_simulations, SIMULATION_BLOCK_SIZE)]
+    results = []
+
+    def collect(result):
+        results.append(result)
+        if progress is not None:
+            progress(sum(paths.shape[1] for paths, _ in results), num_simulations)
+
+    if not workers or workers <= 1 or len(blocks) <= 1:
+        for block in blocks:
+            collect(_simulate_policy_batch(returns, prior_means, prior_vars,
+                                           [np.random.default_rng(s) for s in block], **options))
+    else:
+        # Process-pool machinery is only loaded when a run actually fans out
+        from concurrent.futures import ProcessPoolExecutor
+        from multiprocessing import shared_memory
+
+        # Place the returns matrix in shared memory once instead of pickling it per task
+        shm = shared_memory.SharedMemory(create=True, size=max(returns.nbytes, 1))
+        try:
+            shared = np.ndarray(returns.shape, dtype=np.float64, buffer=shm.buf)
+            shared[:] = returns
+            del shared
+            with ProcessPoolExecutor(max_workers=min(workers, len(blocks))) as pool:
+                futures = [
+                    pool.submit(_simulate_block_shared, shm.name, returns.shape, prior_means,
+                                prior_vars, block, options)
+                    for block in blocks
+                ]
+                for future in futures:
+                    collect(future.result())
+        finally:
+            shm.close()
+            shm.unlink()
+
+    all_portfolios = np.concatenate([paths for paths, _ in results], axis=1)
+    picks = np.concatenate([block_picks for _, block_picks in results], axis=1)
+    return all_portfolios, picks
+
+
+class SymbolSelections:
+    """Stock selections stored as compact integer codes into a symbol table
+
+    Iterating yields ticker strings for code that expects a list, while
+    counts and sector allocation aggregate the codes with np.bincount.
+    """
+
+    def __init__(self, codes, symbols):
+        self.symbols = list(symbols)
+        self.codes = np.asarray(codes).ravel().astype(selection_code_dtype(len(self.symbols)), copy=False)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        return iter(np.asarray(self.symbols, dtype=object)[self.codes].tolist())
+
+    def counts(self):
+        """Selection count per symbol, in symbol-table order"""
+        return pd.Series(np.bincount(self.codes, minlength=len(self.symbols)), index=self.symbols)
+
+    def value_counts(self):
+        """Counts of selected symbols, most frequent first, like pd.Series.value_counts"""
+        counts = self.counts()
+        return counts[counts > 0].sort_values(ascending=False, kind='stable')
+
+
+class SimulationResult:
+    """Full output of one run_multiple_simulations call
+
+    Holds the (N, T+1) portfolio value paths and the (N, T) matrix of selected
+    symbol indices, so risk metrics, benchmarks and charts can all read from a
+    single computed run.
+    """
+
+    def __init__(self, symbols, portfolio_values, selection_indices, initial_investment=100000):
+        self.symbols = list(symbols)
+        self.portfolio_values = portfolio_values
+        self.selection_indices = np.asarray(selection_indices, dtype=selection_code_dtype(len(self.symbols)))
+        self.initial_investment = initial_investment
+
+        self.avg_portfolio = np.mean(portfolio_values, axis=0)
+        self.std_portfolio = np.std(portfolio_values, axis=0)
+        self.total_returns = (portfolio_values[:, -1] / initial_investment - 1) * 100
+        daily_returns = np.diff(portfolio_values, axis=1) / portfolio_values[:, :-1]
+        self.sharpe_ratios = np.mean(daily_returns, axis=1) / np.std(daily_returns, axis=1) * np.sqrt(252)
+
+    @property
+    def num_simulations(self):
+        return len(self.portfolio_values)
+
+    @property
+    def selections(self):
+        return SymbolSelections(self.selection_indices, self.symbols)
+
+    def summary(self):
+        """The (avg, std, mean_ret, std_ret, mean_sharpe, std_sharpe, selections) tuple"""
+        return (
+            self.avg_portfolio, self.std_portfolio,
+            np.mean(self.total_returns), np.std(self.total_returns),
+            np.mean(self.sharpe_ratios), np.std(self.sharpe_ratios),
+            self.selections
+        )
+
+
+def _hash_into(digest, value):
+    if isinstance(value, pd.DataFrame):
+        digest.update(b'frame')
+        _hash_into(digest, [str(column) for column in value.columns])
+        _hash_into(digest, value.index.to_numpy())
+        _hash_into(digest, value.to_numpy())
+    elif isinstance(value, pd.Series):
+        digest.update(b'series')
+        _hash_into(digest, value.index.to_numpy())
+        _hash_into(digest, value.to_numpy())
+    elif isinstance(value, np.ndarray):
+        if value.dtype == object:
+            _hash_into(digest, value.tolist())
+        else:
+            digest.update(f'array{value.dtype.str}{value.shape}'.encode())
+            digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f'seq{len(value)}'.encode())
+        for item in value:
+            _hash_into(digest, item)
+    elif isinstance(value, dict):
+        digest.update(f'map{len(value)}'.encode())
+        for key in sorted(value, key=repr):
+            _hash_into(digest, key)
+            _hash_into(digest, value[key])
+    elif isinstance(value, Policy):
+        _hash_into(digest, (type(value).__name__, vars(value)))
     else:
-        close_data = data if 'Close' in data else pd.DataFrame()
+        digest.update(f'{type(value).__name__}:{value!r};'.encode())
+
+
+def simulation_key(*parts):
+    """Content hash of simulation inputs: symbols, price frames, parameters, seed and counts
+
+    Price DataFrames are hashed by value, so two requests for the same symbols
+    and dates share a key only while the underlying prices are the same.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    _hash_into(digest, parts)
+    return digest.hexdigest()
+
+
+class SimulationCache:
+    """Bounded LRU of simulation outputs keyed by simulation_key
+
+    Thread-safe, so one instance can be shared by every session of the app.
+    Cached results are handed out as-is and must not be modified.
+    """
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
 
-    close_data = close_data.ffill().dropna(axis=1, how='all')
-    valid_symbols = list(close_data.columns)
+    def __contains__(self, key):
+        return key in self._entries
 
-    returns_data = close_data.pct_change().dropna()
-    stats = returns_data.agg(['mean', 'std'], axis=0).T
-    stats['sharpe'] = stats['mean'] / stats['std']
-    return close_data[valid_symbols], stats.loc[valid_symbols]
+    def get_or_run(self, key, run):
+        """Cached value for key, or the result of run() stored under it"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        # Run outside the lock so other sessions are not blocked; concurrent
+        # misses on the same key compute the same deterministic result
+        value = run()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
 
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
 
-def run_multiple_simulations(trader_class, portfolio, data, stats, num_simulations=100, seed=None):
+
+def _thompson_inputs(portfolio, data, stats):
+    """Symbols with stats, their (T, K) returns matrix, prior means and return variances"""
+    valid_symbols = [s for s in portfolio if s in stats.index]
+    returns = np.ascontiguousarray(
+        data.pct_change().dropna()[valid_symbols].to_numpy(dtype=np.float64)
+    )
+    prior_means = stats.loc[valid_symbols, 'mean'].to_numpy(dtype=np.float64)
+    return_vars = stats.loc[valid_symbols, 'std'].to_numpy(dtype=np.float64) ** 2
+    return valid_symbols, returns, prior_means, return_vars
+
+
+def _trader_options(trader_class, **options):
+    """Keyword options trader_class accepts, and whether it takes rng=
+
+    Trader classes written against the original (symbols, stock_data, stats,
+    initial_investment) signature only get the options they declare; asking
+    for a non-default value of one they lack is an error rather than a silent
+    fallback.
+    """
+    parameters = inspect.signature(trader_class).parameters
+    if any(p.kind is inspect.Parameter.VAR_KEYWORD for p in parameters.values()):
+        return options, True
+    defaults = inspect.signature(ThompsonSamplingStockTrader).parameters
+    accepted = {}
+    for name, value in options.items():
+        if name in parameters:
+            accepted[name] = value
+        elif value != defaults[name].default:
+            raise TypeError(f"{trader_class.__name__} does not accept {name}={value!r}")
+    return accepted, 'rng' in parameters
+
+
+def run_multiple_simulations(trader_class, portfolio, data, stats, num_simulations=100, seed=None,
+                             workers=None, return_result=False, progress=None,
+                             prior_inflation=PRIOR_INFLATION, obs_var=OBS_VAR, top_k=1, policy=None):
+    # progress(simulations_done, num_simulations) is called as simulations finish
+    # top_k > 1 holds the k best-sampled stocks each day with equal capital
+    # policy, a policies.POLICIES name or Policy, runs on the batch engine in place of trader_class
+    _check_top_k(top_k)
     # Filter portfolio to symbols available in stats
     valid_symbols = [s for s in portfolio if s in stats.index]
 
-    all_portfolios = []
-    all_selections = []
+    with span('run_multiple_simulations', simulations=num_simulations, symbols=len(valid_symbols)):
+        if policy is not None or trader_class is ThompsonSamplingStockTrader:
+            # Plain Thompson Sampling runs on the vectorized batch engine; subclasses
+            # may override select/update, so they keep the per-trader loop below
+            initial_investment = 100000
+            with span('run_multiple_simulations.inputs'):
+                valid_symbols, returns, prior_means, return_vars = _thompson_inputs(portfolio, data, stats)
+
+            with span('run_multiple_simulations.simulate', days=len(returns)):
+                all_portfolios, picks = _simulate_policy_blocks(
+                    returns, prior_means, return_vars[None] * prior_inflation, num_simulations, seed,
+                    workers, progress, initial_investment=initial_investment, obs_vars=(obs_var,),
+                    top_k=top_k, policies=get_policy(policy)
+                )
+            all_portfolios, picks = all_portfolios[0], picks[0]
+        else:
+            all_portfolios = []
+            all_picks = []
+
+            options, takes_rng = _trader_options(trader_class, prior_inflation=prior_inflation,
+                                                 obs_var=obs_var, top_k=top_k)
+            with span('run_multiple_simulations.simulate', trader=trader_class.__name__):
+                for i, rng in enumerate(simulation_rngs(seed, num_simulations)):
+                    if takes_rng:
+                        trader = trader_class(valid_symbols, data, stats, rng=rng, **options)
+                    else:
+                        # Traders with the original signature get the simulation's
+                        # Generator after construction; ones without an rng
+                        # attribute draw from the global RNG, seeded as before
+                        if seed is not None:
+                            np.random.seed(seed + i)
+                        trader = trader_class(valid_symbols, data, stats, **options)
+                        if hasattr(trader, 'rng'):
+                            trader.rng = rng
+                    trader.run()
+                    all_portfolios.append(trader.portfolio_values)
+                    all_picks.append(trader.selection_indices)
+                    if progress is not None:
+                        progress(len(all_portfolios), num_simulations)
+
+            initial_investment = trader.initial_investment
+            all_portfolios = np.array(all_portfolios)
+            picks = np.array(all_picks)
+
+        result = SimulationResult(valid_symbols, all_portfolios, picks, initial_investment)
+        if return_result:
+            return result
+        with span('run_multiple_simulations.summary'):
+            return result.summary()
+
 
-    for i in range(num_simulations):
-        if seed is not None:
-            np.random.seed(seed + i)
+def run_portfolio_simulations(portfolios, data, stats, num_simulations=100, seed=None, workers=None,
+                              prior_inflation=PRIOR_INFLATION, obs_var=OBS_VAR, top_k=1, policy=None,
+                              progress=None):
+    """One bandit policy (Thompson Sampling by default) over several portfolios in one vectorized sweep
 
-        trader = trader_class(valid_symbols, data, stats)
-        trader.run()
-        all_portfolios.append(trader.portfolio_values)
-        all_selections.extend(trader.daily_selections)
+    ``data`` and ``stats`` are either shared by every portfolio or sequences
+    aligned with ``portfolios``. Ragged symbol sets and histories are padded
+    into one (T, P, K) returns tensor: padded symbols are masked out of every
+    day's selection, and padded days are cut off each portfolio's paths
+    afterwards. Each portfolio draws the same noise a standalone
+    run_multiple_simulations over its symbols with this seed would, so its
+    results do not depend on the other portfolios in the batch. top_k may
+    not exceed the smallest portfolio, since padded symbols can never be
+    held. Returns one SimulationResult per portfolio.
+    """
+    _check_top_k(top_k)
+    num_portfolios = len(portfolios)
+    if isinstance(data, pd.DataFrame):
+        data = [data] * num_portfolios
+    if isinstance(stats, pd.DataFrame):
+        stats = [stats] * num_portfolios
+    initial_investment = 100000
 
-    all_portfolios = np.array(all_portfolios)
-    avg_portfolio = np.mean(all_portfolios, axis=0)
-    std_portfolio = np.std(all_portfolios, axis=0)
+    with span('run_portfolio_simulations', portfolios=num_portfolios, simulations=num_simulations):
+        with span('run_portfolio_simulations.inputs'):
+            inputs = [_thompson_inputs(portfolio, portfolio_data, portfolio_stats)
+                      for portfolio, portfolio_data, portfolio_stats in zip(portfolios, data, stats)]
+        num_days = max((len(returns) for _, returns, _, _ in inputs), default=0)
+        num_symbols = max((len(symbols) for symbols, _, _, _ in inputs), default=0)
+        if top_k > 1 and any(len(symbols) < top_k for symbols, _, _, _ in inputs):
+            raise ValueError(f"top_k={top_k} exceeds the number of symbols in a portfolio")
 
-    total_returns = (all_portfolios[:, -1] / trader.initial_investment - 1) * 100
-    sharpe_ratios = []
-    for i in range(num_simulations):
-        daily_returns = np.diff(all_portfolios[i]) / all_portfolios[i][:-1]
-        sharpe = np.mean(daily_returns) / np.std(daily_returns) * np.sqrt(252)
-        sharpe_ratios.append(sharpe)
+        returns = np.zeros((num_days, num_portfolios, num_symbols))
+        prior_means = np.zeros((num_portfolios, num_symbols))
+        prior_vars = np.ones((num_portfolios, num_symbols))
+        active = np.zeros((num_portfolios, num_symbols), dtype=bool)
+        for p, (symbols, portfolio_returns, means, return_vars) in enumerate(inputs):
+            returns[:len(portfolio_returns), p, :len(symbols)] = portfolio_returns
+            prior_means[p, :len(symbols)] = means
+            prior_vars[p, :len(symbols)] = return_vars * prior_inflation
+            active[p, :len(symbols)] = True
 
-    mean_return = np.mean(total_returns)
-    std_return = np.std(total_returns)
-    mean_sharpe = np.mean(sharpe_ratios)
-    std_sharpe = np.std(sharpe_ratios)
+        with span('run_portfolio_simulations.simulate', days=num_days, symbols=num_symbols):
+            all_portfolios, picks = _simulate_policy_blocks(
+                returns, prior_means, prior_vars, num_simulations, seed, workers, progress,
+                initial_investment=initial_investment, obs_vars=[obs_var] * num_portfolios,
+                top_k=top_k, policies=get_policy(policy), active=active
+            )
 
-    return avg_portfolio, std_portfolio, mean_return, std_return, mean_sharpe, std_sharpe, all_selections
+        results = []
+        for p, (symbols, portfolio_returns, _, _) in enumerate(inputs):
+            length = len(portfolio_returns)
+            results.append(SimulationResult(symbols, all_portfolios[p, :, :length + 1],
+                                            picks[p, :, :length], initial_investment))
+        return results
 
 
+def sweep_hyperparameters(portfolio, data, stats, prior_inflations=(PRIOR_INFLATION,), obs_vars=(OBS_VAR,),
+                          num_simulations=100, seed=None, workers=None, initial_investment=100000,
+                          policy=None, progress=None):
+    """Evaluate every (prior_inflation, obs_var) combination over the same seeds in one batched pass
+
+    All configurations share the returns matrix and each seed's noise draws,
+    so the comparison between them is not blurred by sampling luck. Returns a
+    DataFrame with one row per configuration: mean and std across simulations
+    of total return (%), annualized Sharpe ratio and max drawdown (%).
+    """
+    grid = list(itertools.product(prior_inflations, obs_vars))
+    _, returns, prior_means, return_vars = _thompson_inputs(portfolio, data, stats)
+    prior_vars = np.array([return_vars * inflation for inflation, _ in grid]).reshape(len(grid), len(return_vars))
+
+    all_portfolios, _ = _simulate_policy_blocks(
+        returns, prior_means, prior_vars, num_simulations, seed, workers, progress,
+        initial_investment=initial_investment, obs_vars=[obs_var for _, obs_var in grid],
+        policies=get_policy(policy)
+    )
+
+    num_configs, _, length = all_portfolios.shape
+    metrics, _, _ = calculate_batch_risk_metrics(all_portfolios.reshape(-1, length))
+    total_returns = (all_portfolios[:, :, -1] / initial_investment - 1) * 100
+    sharpe = metrics['sharpe_ratio'].reshape(num_configs, -1)
+    drawdown = metrics['max_drawdown'].reshape(num_configs, -1)
+
+    return pd.DataFrame({
+        'prior_inflation': [inflation for inflation, _ in grid],
+        'obs_var': [obs_var for _, obs_var in grid],
+        'mean_return': total_returns.mean(axis=1),
+        'std_return': total_returns.std(axis=1),
+        'mean_sharpe': sharpe.mean(axis=1),
+        'std_sharpe': sharpe.std(axis=1),
+        'mean_max_drawdown': drawdown.mean(axis=1),
+        'std_max_drawdown': drawdown.std(axis=1)
+    })
+
+
+def compare_policies(policies, portfolio, data, stats, num_simulations=100, seed=None, workers=None,
+                     prior_inflation=PRIOR_INFLATION, obs_var=OBS_VAR, top_k=1, progress=None):
+    """Run several bandit policies over the same portfolio and seeds in one batched pass
+
+    ``policies`` are policies.POLICIES names or Policy instances. They share
+    the returns matrix, the priors and every seed's noise draws. Returns a
+    dict of SimulationResult keyed by policy name, in the given order.
+    """
+    _check_top_k(top_k)
+    policies = [get_policy(policy) for policy in policies]
+    valid_symbols, returns, prior_means, return_vars = _thompson_inputs(portfolio, data, stats)
+    prior_vars = np.tile(return_vars * prior_inflation, (len(policies), 1))
+    initial_investment = 100000
+
+    all_portfolios, picks = _simulate_policy_blocks(
+        returns, prior_means, prior_vars, num_simulations, seed, workers, progress,
+        initial_investment=initial_investment, obs_vars=[obs_var] * len(policies),
+        top_k=top_k, policies=policies
+    )
+    return {
+        policy.name: SimulationResult(valid_symbols, all_portfolios[i], picks[i], initial_investment)
+        for i, policy in enumerate(policies)
+    }
+
+
+def trailing_moments(returns, lookback):
+    """Mean and sample variance of the lookback days before every row of a (T, K) returns array
+
+    Row t of the outputs covers returns[t - lookback:t], computed from prefix
+    sums of returns and squared returns so every window costs O(K). Rows with
+    fewer than lookback prior days are NaN.
+    """
+    num_days, num_symbols = returns.shape
+    sums = np.zeros((num_days + 1, num_symbols))
+    squares = np.zeros((num_days + 1, num_symbols))
+    np.cumsum(returns, axis=0, out=sums[1:])
+    np.cumsum(np.square(returns), axis=0, out=squares[1:])
+
+    means = np.full((num_days + 1, num_symbols), np.nan)
+    variances = np.full((num_days + 1, num_symbols), np.nan)
+    if lookback <= num_days:
+        window_sum = sums[lookback:] - sums[:-lookback]
+        window_squares = squares[lookback:] - squares[:-lookback]
+        means[lookback:] = window_sum / lookback
+        variances[lookback:] = np.maximum(window_squares - lookback * means[lookback:] ** 2, 0) / max(lookback - 1, 1)
+    return means, variances
+
+
+def walk_forward_backtest(portfolio, data, lookback=252, test_days=21, num_simulations=100, seed=None,
+                          prior_inflation=PRIOR_INFLATION, obs_var=OBS_VAR, initial_investment=100000,
+                          policy=None, progress=None):
+    """Out-of-sample Thompson Sampling over consecutive test windows with trailing priors
+
+    Each window of test_days returns starts from priors fitted only on the
+    lookback days before it, so nothing after the window start leaks in. The
+    windows tile the data after the first lookback days, capital carries over
+    from one window to the next and each simulation keeps one noise stream
+    throughout, so the whole study costs about one pass of the batch engine
+    over the data.
+
+    Returns (result, windows): a SimulationResult for the stitched
+    out-of-sample paths and a DataFrame with each window's dates and the
+    mean/std of its return (%) across simulations. Raises ValueError when
+    lookback leaves no days to test on.
+    """
+    valid_symbols = [s for s in portfolio if s in data.columns]
+    returns_data = data.pct_change().dropna()[valid_symbols]
+    returns = np.ascontiguousarray(returns_data.to_numpy(dtype=np.float64))
+    num_days, num_symbols = returns.shape
+    if lookback < 1:
+        raise ValueError("lookback must be >= 1")
+    if lookback >= num_days:
+        raise ValueError(f"lookback={lookback} leaves no test days in {num_days} days of returns")
+    means, variances = trailing_moments(returns, lookback)
+
+    starts = list(range(lookback, num_days, test_days))
+    test_length = num_days - lookback
+    growth = np.empty((num_simulations, test_length))
+    picks = np.empty((num_simulations, test_length), dtype=selection_code_dtype(num_symbols))
+    rngs = simulation_rngs(seed, num_simulations)
+    policy = get_policy(policy)
+    windows = []
+
+    for i, start in enumerate(starts):
+        stop = min(start + test_days, num_days)
+        paths, window_picks = _simulate_policy_batch(
+            returns[start:stop], means[start], floor_prior_vars(variances[start][None] * prior_inflation),
+            rngs, 1.0, (obs_var,), policies=policy
+        )
+        growth[:, start - lookback:stop - lookback] = paths[0, :, 1:] / paths[0, :, :-1]
+        picks[:, start - lookback:stop - lookback] = window_picks[0]
+
+        window_returns = (paths[0, :, -1] - 1) * 100
+        windows.append({
+            'start': returns_data.index[start],
+            'end': returns_data.index[stop - 1],
+            'mean_return': np.mean(window_returns),
+            'std_return': np.std(window_returns)
+        })
+        if progress is not None:
+            progress(i + 1, len(starts))
+
+    all_portfolios = _compound(growth - 1, initial_investment)
+    result = SimulationResult(valid_symbols, all_portfolios, picks, initial_investment)
+    return result, pd.DataFrame(windows, columns=['start', 'end', 'mean_return', 'std_return'])
+
 
 # Define portfolios here so they can be imported directly
 portfolio1 = [
@@ -180,19 +1082,31 @@ sector_mapping = {
     'MOTHERSON.NS': 'Auto Components'
 }
 
+def _sector_codes(symbols):
+    """Sector names and the per-symbol sector code vector (-1 for unmapped symbols)"""
+    sectors = list(dict.fromkeys(sector_mapping[s] for s in symbols if s in sector_mapping))
+    sector_index = {sector: i for i, sector in enumerate(sectors)}
+    codes = np.array([sector_index.get(sector_mapping.get(s), -1) for s in symbols], dtype=np.intp)
+    return sectors, codes
+
 def get_sector_allocation(selections, symbols):
     """Calculate sector-wise allocation from stock selections"""
-    sector_counts = {}
+    if not isinstance(selections, SymbolSelections):
+        codes, table = pd.factorize(pd.Series(list(selections), dtype=object))
+        selections = SymbolSelections(codes, table)
     total_selections = len(selections)
+    if total_selections == 0:
+        return {}
     
-    for selection in selections:
-        if selection in sector_mapping:
-            sector = sector_mapping[selection]
-            sector_counts[sector] = sector_counts.get(sector, 0) + 1
+    # Per-symbol counts, folded into sectors through the symbol -> sector code vector
+    sectors, codes = _sector_codes(selections.symbols)
+    symbol_counts = np.bincount(selections.codes, minlength=len(selections.symbols))
+    mapped = codes >= 0
+    sector_counts = np.bincount(codes[mapped], weights=symbol_counts[mapped], minlength=len(sectors))
     
     # Convert to percentages
-    sector_allocation = {sector: (count / total_selections) * 100 
-                        for sector, count in sector_counts.items()}
+    sector_allocation = {sector: (count / total_selections) * 100
+                         for sector, count in zip(sectors, sector_counts) if count > 0}
     
     return sector_allocation
 
@@ -211,6 +1125,13 @@ def get_portfolio_sectors(symbols):
     
     return sector_breakdown
 
+def _compound(returns, initial_investment):
+    """Portfolio values from daily returns along the last axis, starting at initial_investment"""
+    growth = np.empty(returns.shape[:-1] + (returns.shape[-1] + 1,))
+    growth[..., 0] = initial_investment
+    growth[..., 1:] = 1 + returns
+    return np.cumprod(growth, axis=-1)
+
 def calculate_buy_and_hold_performance(symbols, data, initial_investment=100000):
     """Calculate buy-and-hold strategy performance"""
     if len(symbols) == 0:
@@ -219,106 +1140,280 @@ def calculate_buy_and_hold_performance(symbols, data, initial_investment=100000)
     # Equal weight allocation
     weights = np.ones(len(symbols)) / len(symbols)
     
-    # Calculate portfolio returns
-    returns_data = data[symbols].pct_change().dropna()
-    portfolio_returns = (returns_data * weights).sum(axis=1)
-    
-    # Calculate cumulative portfolio value
-    portfolio_values = [initial_investment]
-    for ret in portfolio_returns:
-        portfolio_values.append(portfolio_values[-1] * (1 + ret))
+    # Calculate portfolio returns and cumulative portfolio value
+    returns = data[symbols].pct_change().dropna().to_numpy(dtype=np.float64)
+    portfolio_values = _compound(returns @ weights, initial_investment)
     
     # Calculate metrics
     total_return = (portfolio_values[-1] / initial_investment - 1) * 100
-    daily_returns = np.diff(portfolio_values) / portfolio_values[:-1]
-    sharpe_ratio = np.mean(daily_returns) / np.std(daily_returns) * np.sqrt(252) if np.std(daily_returns) > 0 else 0
+    metrics, _, _ = calculate_batch_risk_metrics(portfolio_values)
+    sharpe_ratio = metrics['sharpe_ratio'][0]
     
     return portfolio_values, total_return, sharpe_ratio
 
-def calculate_random_selection_performance(symbols, data, initial_investment=100000, seed=None):
+def simulate_random_selection(symbols, data, num_simulations=1, initial_investment=100000, seed=None, rngs=None):
+    """Portfolio value paths (N, T+1) for picking one stock at random each day, one row per seed"""
+    returns = data[symbols].pct_change().dropna().to_numpy(dtype=np.float64)
+    num_days = len(returns)
+    if rngs is None:
+        rngs = simulation_rngs(seed, num_simulations)
+    
+    # Draw every simulation's daily picks, then gather all rewards in one (N, T) fancy index
+    picks = np.stack([rng.integers(len(symbols), size=num_days) for rng in rngs])
+    rewards = returns[np.arange(num_days), picks]
+    return _compound(rewards, initial_investment)
+
+def calculate_random_selection_performance(symbols, data, initial_investment=100000, seed=None, rng=None):
     """Calculate random selection strategy performance"""
     if len(symbols) == 0:
         return [], 0, 0
     
-    if seed is not None:
-        np.random.seed(seed)
-    
-    returns_data = data[symbols].pct_change().dropna()
-    portfolio_values = [initial_investment]
+    if rng is None:
+        rng = np.random.default_rng(seed)
     
-    for date in returns_data.index:
-        # Randomly select one stock each day
-        selected_stock = np.random.choice(symbols)
-        daily_return = returns_data.loc[date, selected_stock]
-        portfolio_values.append(portfolio_values[-1] * (1 + daily_return))
+    portfolio_values = simulate_random_selection(symbols, data, initial_investment=initial_investment, rngs=[rng])[0]
     
     # Calculate metrics
     total_return = (portfolio_values[-1] / initial_investment - 1) * 100
-    daily_returns = np.diff(portfolio_values) / portfolio_values[:-1]
-    sharpe_ratio = np.mean(daily_returns) / np.std(daily_returns) * np.sqrt(252) if np.std(daily_returns) > 0 else 0
+    metrics, _, _ = calculate_batch_risk_metrics(portfolio_values)
+    sharpe_ratio = metrics['sharpe_ratio'][0]
     
     return portfolio_values, total_return, sharpe_ratio
 
+RISK_METRICS = ('max_drawdown', 'volatility', 'var_95', 'cvar_95', 'calmar_ratio', 'sharpe_ratio')
+
+
+def calculate_batch_risk_metrics(portfolio_values):
+    """Calculate risk metrics for every simulation in an (N, T+1) matrix of portfolio values
+
+    Returns (metrics, mean_metrics, std_metrics): per-simulation arrays keyed by
+    metric name, plus their mean and std across simulations.
+    """
+    paths = np.atleast_2d(np.asarray(portfolio_values, dtype=np.float64))
+    num_simulations, length = paths.shape
+
+    with span('calculate_batch_risk_metrics', simulations=num_simulations, days=max(length - 1, 0)):
+        if length < 2:
+            metrics = {key: np.zeros(num_simulations) for key in RISK_METRICS}
+        else:
+            # Calculate daily returns
+            daily_returns = np.diff(paths, axis=1) / paths[:, :-1]
+
+            # Maximum Drawdown from the running peak of each path
+            peaks = np.maximum.accumulate(paths, axis=1)
+            max_drawdown = ((peaks - paths) / peaks).max(axis=1)
+
+            # Volatility (annualized)
+            daily_std = np.std(daily_returns, axis=1)
+            volatility = daily_std * np.sqrt(252)
+
+            # Value at Risk and Conditional Value at Risk (95% confidence)
+            var_95 = np.percentile(daily_returns, 5, axis=1)
+            tail = daily_returns <= var_95[:, None]
+            cvar_95 = np.where(tail, daily_returns, 0).sum(axis=1) / tail.sum(axis=1)
+
+            # Calmar Ratio (annualized return / max drawdown)
+            total_return = paths[:, -1] / paths[:, 0] - 1
+            annualized_return = (1 + total_return) ** (252 / daily_returns.shape[1]) - 1
+            has_drawdown = max_drawdown > 0
+            calmar_ratio = np.where(has_drawdown, annualized_return / np.where(has_drawdown, max_drawdown, 1), 0)
+
+            # Sharpe Ratio (annualized, zero risk-free rate)
+            has_volatility = daily_std > 0
+            sharpe_ratio = np.where(
+                has_volatility,
+                np.mean(daily_returns, axis=1) / np.where(has_volatility, daily_std, 1) * np.sqrt(252),
+                0
+            )
+
+            metrics = {
+                'max_drawdown': max_drawdown * 100,  # Convert to percentage
+                'volatility': volatility * 100,      # Convert to percentage
+                'var_95': var_95 * 100,              # Convert to percentage
+                'cvar_95': cvar_95 * 100,            # Convert to percentage
+                'calmar_ratio': calmar_ratio,
+                'sharpe_ratio': sharpe_ratio
+            }
+
+        mean_metrics = {key: np.mean(values) for key, values in metrics.items()}
+        std_metrics = {key: np.std(values) for key, values in metrics.items()}
+        return metrics, mean_metrics, std_metrics
+
 def calculate_risk_metrics(portfolio_values):
     """Calculate various risk metrics for a portfolio"""
-    if len(portfolio_values) < 2:
-        return {
-            'max_drawdown': 0,
-            'volatility': 0,
-            'var_95': 0,
-            'cvar_95': 0,
-            'calmar_ratio': 0
-        }
-    
-    # Calculate daily returns
-    daily_returns = np.diff(portfolio_values) / portfolio_values[:-1]
-    
-    # Maximum Drawdown
-    peak = portfolio_values[0]
-    max_drawdown = 0
-    for value in portfolio_values:
-        if value > peak:
-            peak = value
-        drawdown = (peak - value) / peak
-        max_drawdown = max(max_drawdown, drawdown)
-    
-    # Volatility (annualized)
-    volatility = np.std(daily_returns) * np.sqrt(252)
-    
-    # Value at Risk (95% confidence)
-    var_95 = np.percentile(daily_returns, 5)
-    
-    # Conditional Value at Risk (95% confidence)
-    cvar_95 = np.mean(daily_returns[daily_returns <= var_95])
-    
-    # Calmar Ratio (annualized return / max drawdown)
-    total_return = (portfolio_values[-1] / portfolio_values[0] - 1)
-    annualized_return = (1 + total_return) ** (252 / len(daily_returns)) - 1
-    calmar_ratio = annualized_return / max_drawdown if max_drawdown > 0 else 0
-    
-    return {
-        'max_drawdown': max_drawdown * 100,  # Convert to percentage
-        'volatility': volatility * 100,      # Convert to percentage
-        'var_95': var_95 * 100,              # Convert to percentage
-        'cvar_95': cvar_95 * 100,            # Convert to percentage
-        'calmar_ratio': calmar_ratio
-    }
+    metrics, _, _ = calculate_batch_risk_metrics(portfolio_values)
+    return {key: metrics[key][0] for key in RISK_METRICS if key != 'sharpe_ratio'}
 
 def calculate_portfolio_risk_metrics(portfolio_values_list):
     """Calculate risk metrics for multiple portfolio simulations"""
-    all_metrics = []
-    
-    for portfolio_values in portfolio_values_list:
-        metrics = calculate_risk_metrics(portfolio_values)
-        all_metrics.append(metrics)
-    
-    # Calculate mean and std of risk metrics
-    mean_metrics = {}
-    std_metrics = {}
-    
-    for key in all_metrics[0].keys():
-        values = [m[key] for m in all_metrics]
-        mean_metrics[key] = np.mean(values)
-        std_metrics[key] = np.std(values)
-    
+    with span('calculate_portfolio_risk_metrics'):
+        _, mean_metrics, std_metrics = calculate_batch_risk_metrics(portfolio_values_list)
     return mean_metrics, std_metrics
+
+
+def downsample_indices(values, max_points=CHART_MAX_POINTS):
+    """Sorted row indices of a (T,) or (T, M) array that keep every column's shape in at most max_points rows
+
+    The first and last rows are always kept and the rows in between are split
+    into (max_points - 2) // (2 * M) equal buckets, keeping the rows holding
+    each column's minimum and maximum in every bucket. Peaks and troughs
+    therefore survive however long the history is, and since all columns
+    share one index set, bands built from them stay aligned with their lines.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    num_rows = len(values)
+    if max_points is None or num_rows <= max(max_points, 4):
+        return np.arange(num_rows)
+
+    interior = values[1:-1]
+    # Every bucket can add a min and a max row per column
+    bucket_size = -(-len(interior) // max((max_points - 2) // (2 * values.shape[1]), 1))
+    num_buckets = -(-len(interior) // bucket_size)
+    buckets = np.full((num_buckets * bucket_size, values.shape[1]), np.nan)
+    buckets[:len(interior)] = interior
+    buckets = buckets.reshape(num_buckets, bucket_size, -1)
+    missing = np.isnan(buckets)
+
+    offsets = 1 + bucket_size * np.arange(num_buckets)[:, None]
+    lows = np.argmin(np.where(missing, np.inf, buckets), axis=1) + offsets
+    highs = np.argmax(np.where(missing, -np.inf, buckets), axis=1) + offsets
+    return np.unique(np.concatenate([[0, num_rows - 1], lows.ravel(), highs.ravel()]))
+
+
+def downsample_frame(frame, max_points=CHART_MAX_POINTS, x='Day'):
+    """Rows of a chart DataFrame chosen by downsample_indices over every column but x"""
+    columns = [column for column in frame.columns if column != x]
+    return frame.iloc[downsample_indices(frame[columns].to_numpy(dtype=np.float64), max_points)]
+
+
+def _strategy_row(strategy, portfolio_values):
+    """Mean/std return and Sharpe plus mean risk metrics over an (N, T+1) path matrix"""
+    paths = np.atleast_2d(portfolio_values)
+    metrics, mean_metrics, _ = calculate_batch_risk_metrics(paths)
+    total_returns = (paths[:, -1] / paths[:, 0] - 1) * 100
+    row = {
+        'strategy': strategy,
+        'simulations': len(paths),
+        'mean_return': np.mean(total_returns),
+        'std_return': np.std(total_returns),
+        'mean_sharpe': mean_metrics['sharpe_ratio'],
+        'std_sharpe': np.std(metrics['sharpe_ratio'])
+    }
+    row.update({key: mean_metrics[key] for key in RISK_METRICS if key != 'sharpe_ratio'})
+    return row
+
+
+def evaluate_strategies(symbols, start_date, end_date, num_simulations=100, seed=None, workers=None,
+                        provider=None, policy=None, top_k=1, progress=None):
+    """Run the bandit simulations and the buy-and-hold and random baselines for one portfolio
+
+    Returns (summary, series, result): one summary row per strategy, the daily
+    mean portfolio value of each strategy indexed by date, and the bandit
+    SimulationResult.
+    """
+    data, stats = download_and_prepare_data(symbols, start_date, end_date, provider=provider)
+    valid_symbols = list(stats.index)
+    result = run_multiple_simulations(ThompsonSamplingStockTrader, valid_symbols, data, stats, num_simulations,
+                                      seed, workers, return_result=True, progress=progress,
+                                      top_k=top_k, policy=policy)
+    with span('evaluate_strategies.baselines'):
+        bh_values, _, _ = calculate_buy_and_hold_performance(valid_symbols, data)
+        rs_paths = simulate_random_selection(valid_symbols, data, num_simulations, seed=seed)
+
+    policy_name = get_policy(policy).name
+    summary = pd.DataFrame([
+        _strategy_row(policy_name, result.portfolio_values),
+        _strategy_row('buy_and_hold', bh_values),
+        _strategy_row('random_selection', rs_paths)
+    ])
+    series = pd.DataFrame({
+        f'{policy_name}_mean': result.avg_portfolio,
+        f'{policy_name}_std': result.std_portfolio,
+        'buy_and_hold': bh_values,
+        'random_selection_mean': rs_paths.mean(axis=0),
+        'random_selection_std': rs_paths.std(axis=0)
+    }, index=data.index[len(data.index) - len(bh_values):])
+    series.index.name = 'date'
+    return summary, series, result
+
+
+def main(argv=None):
+    """Headless batch runner: python -m thompson_trader portfolio1 --output results.json"""
+    parser = argparse.ArgumentParser(
+        prog='python -m thompson_trader',
+        description='Run bandit trading simulations and baselines without the Streamlit app'
+    )
+    parser.add_argument('symbols', nargs='+', help="ticker symbols, or 'portfolio1' / 'portfolio2'")
+    parser.add_argument('--start', default=(pd.Timestamp.today() - pd.Timedelta(days=365)).strftime('%Y-%m-%d'),
+                        help='start date (default: one year ago)')
+    parser.add_argument('--end', default=pd.Timestamp.today().strftime('%Y-%m-%d'), help='end date (default: today)')
+    parser.add_argument('--simulations', type=int, default=100, help='number of simulations')
+    parser.add_argument('--seed', type=int, default=42, help='random seed')
+    parser.add_argument('--workers', type=int, help='worker processes for the simulations')
+    parser.add_argument('--provider', choices=sorted(PROVIDERS), help='market data provider (default: THOMPSON_DATA_PROVIDER or yahoo)')
+    parser.add_argument('--data-dir', help="price directory; implies --provider directory")
+    parser.add_argument('--cache-dir', help='serve prices through an on-disk PriceCache in this directory')
+    parser.add_argument('--policy', choices=list(POLICIES), default=GaussianThompson.name, help='bandit policy')
+    parser.add_argument('--top-k', type=int, default=1, help='stocks held per day')
+    parser.add_argument('--output', help='write results here (.json or .parquet)')
+    parser.add_argument('--format', choices=['json', 'parquet'], help='output format (default: from the --output extension)')
+    parser.add_argument('--profile', action='store_true',
+                        help='log stage timings and print cProfile and tracemalloc tables to stderr')
+    args = parser.parse_args(argv)
+    if args.top_k < 1:
+        parser.error('--top-k must be at least 1')
+    if args.data_dir:
+        if args.provider not in (None, DirectoryProvider.name):
+            parser.error(f"--data-dir needs --provider {DirectoryProvider.name}, not '{args.provider}'")
+        args.provider = DirectoryProvider.name
+
+    portfolios = {'portfolio1': portfolio1, 'portfolio2': portfolio2}
+    symbols = [symbol for name in args.symbols for symbol in portfolios.get(name, [name])]
+    provider = get_provider(args.provider, path=args.data_dir) if args.data_dir else get_provider(args.provider)
+    if args.cache_dir:
+        provider = PriceCache(args.cache_dir, provider)
+
+    if args.profile:
+        enable_timing_log()
+    report = PerformanceReport(profile=args.profile, memory=args.profile)
+    with report.activate():
+        summary, series, result = evaluate_strategies(symbols, args.start, args.end, args.simulations, args.seed,
+                                                      args.workers, provider, args.policy, args.top_k)
+    with pd.option_context('display.width', 200, 'display.max_columns', None, 'display.max_colwidth', 100):
+        print(summary.round(4).to_string(index=False))
+        if args.profile:
+            for title, rows in [('Stage timings', report.spans), ('Hot functions', report.hot_functions),
+                                ('Allocation sites', report.allocations)]:
+                print(f"\n{title}:\n{pd.DataFrame(rows).to_string(index=False)}", file=sys.stderr)
+            print(f"\nPeak traced memory: {report.peak_memory_bytes / 2 ** 20:.1f} MiB", file=sys.stderr)
+
+    if args.output:
+        output_format = args.format or ('parquet' if args.output.endswith('.parquet') else 'json')
+        if output_format == 'parquet':
+            # Summary at the given path, daily series alongside it
+            summary.to_parquet(args.output, index=False)
+            stem = args.output[:-len('.parquet')] if args.output.endswith('.parquet') else args.output
+            series.to_parquet(stem + '_series.parquet')
+        else:
+            report = {
+                'symbols': result.symbols,
+                'start_date': args.start,
+                'end_date': args.end,
+                'simulations': args.simulations,
+                'seed': args.seed,
+                'policy': args.policy,
+                'top_k': args.top_k,
+                'summary': summary.to_dict(orient='records'),
+                'selections': {symbol: int(count) for symbol, count in result.selections.value_counts().items()},
+                'sector_allocation': get_sector_allocation(result.selections, result.symbols),
+                'series': json.loads(series.to_json(orient='split', date_format='iso'))
+            }
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2, default=float)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())